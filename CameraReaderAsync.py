@@ -1,54 +1,215 @@
+import time
+from collections import namedtuple
 from threading import Thread
-from threading import Lock
+from threading import Condition
 from WeightedFramerateCounter import WeightedFramerateCounter
+from FramePool import FramePool
 
+# A captured frame with its capture sequence number (starting at 1 and
+# increasing by one per frame read from the source), its capture time,
+# the PTZ state reported by the state source when it was captured and
+# the index of the pool buffer holding the image
+Frame = namedtuple("Frame", ["image", "seq", "timestamp", "ptzState", "poolIndex"])
+
+# Most frames the driver queue is expected to hold, and how long a grab
+# must block before the frame it returns counts as freshly captured
+DRAIN_MAX_FRAMES = 8
+DRAIN_FRESH_SECONDS = 0.005
+
+# Keeps the last few frames read from the source in a fixed ring of slots,
+# so consumers running at different rates can each pick the frame they need
+# without copying it.
+#
+# With decodeOnDemand the capture thread keeps calling grab() to drain the
+# driver queue, but only calls retrieve() to decode a frame while some
+# consumer is waiting for one. Frames that were grabbed and never decoded
+# still use up a sequence number, so they show up as gaps in seq. This
+# saves the decode of every frame nobody looks at, but a consumer that
+# asks for a frame has to wait for the next one to be captured, up to a
+# full frame interval, which costs loop throughput when the consumer is
+# slower than the source. It is off by default.
+#
+# Images are read into buffers recycled from a FramePool. The ring holds a
+# reference to each buffer it stores; a consumer that needs a frame to stay
+# intact after it drops out of the ring asks for it with lease=True and
+# hands it back with Release().
+#
+# Frames queued up in the driver are stale by the time they are read, so
+# the queue is drained on start and whenever the capture thread has not
+# read anything for stallSeconds.
 class CameraReaderAsync:
-    def __init__(self, videoSource):
-        self.__lock = Lock()
+    def __init__(self, videoSource, depth=1, decodeOnDemand=False, stallSeconds=1.0):
+        self.__cond = Condition()
         self.__source = videoSource
+        self.__depth = max(1, depth)
+        self.__decodeOnDemand = decodeOnDemand
+        self.__stallSeconds = stallSeconds
+        self.__ptzStateSource = None
         self.Start()
-        
+
+    # Throw away frames the driver returns without waiting, which were
+    # captured before we asked for them
+    def __Drain(self):
+        for i in range(DRAIN_MAX_FRAMES):
+            start = time.time()
+            if not self.__source.grab():
+                break
+            if time.time() - start > DRAIN_FRESH_SECONDS:
+                break
+            self.framesDrained += 1
+
     def __ReadAsync(self):
+        self.__Drain()
+        lastCaptureTime = time.time()
         while True:
             if self.__stopRequested:
                 return
-            validFrame, frame = self.__source.read()
-            if validFrame:
-                try:
-                    self.__lock.acquire()
+            if time.time() - lastCaptureTime > self.__stallSeconds:
+                self.__Drain()
+            if self.__decodeOnDemand:
+                if not self.__source.grab():
+                    continue
+                timestamp = lastCaptureTime = time.time()
+                with self.__cond:
                     self.fps.tick()
-                    self.__frame = frame
-                    self.__lastFrameRead = False
-                finally:
-                    self.__lock.release()
+                    self.__seq += 1
+                    if not self.__waiting:
+                        self.framesNotDecoded += 1
+                        continue
+                index, buffer = self.__AcquireBuffer()
+                validFrame, frame = self.__source.retrieve(buffer)
+            else:
+                index, buffer = self.__AcquireBuffer()
+                validFrame, frame = self.__source.read(buffer)
+                timestamp = time.time()
+                if validFrame:
+                    lastCaptureTime = timestamp
+                    with self.__cond:
+                        self.fps.tick()
+                        self.__seq += 1
+            if validFrame:
+                self.__Publish(frame, timestamp, index)
+            else:
+                with self.__cond:
+                    self.pool.release(index)
+
+    def __AcquireBuffer(self):
+        with self.__cond:
+            return self.pool.acquire()
+
+    def __Publish(self, image, timestamp, index):
+        ptzState = self.__ptzStateSource() if self.__ptzStateSource else None
+        with self.__cond:
+            self.pool.store(index, image)
+            self.__published += 1
+            slot = self.__published % self.__depth
+            if self.__ring[slot] is not None:
+                self.pool.release(self.__ring[slot].poolIndex)
+            self.__ring[slot] = Frame(image, self.__seq, timestamp, ptzState, index)
+            self.__cond.notify_all()
+
+    def __Lease(self, frame, lease):
+        if lease and frame is not None:
+            self.pool.addRef(frame.poolIndex)
+        return frame
+
+    # Hand back a frame obtained with lease=True
+    def Release(self, frame):
+        with self.__cond:
+            self.pool.release(frame.poolIndex)
 
     def Start(self):
-        self.__lastFrameRead = False
-        self.__frame = None
+        self.__ring = [None] * self.__depth
+        # Room for every ring slot, the frame being captured and a lease
+        self.pool = FramePool(self.__depth + 2)
+        self.__seq = 0
+        self.__published = 0
+        self.__lastReadSeq = 0
+        self.__waiting = 0
+        self.framesNotDecoded = 0
+        self.framesDrained = 0
         self.__stopRequested = False
-        self.__validFrame = False
         self.fps = WeightedFramerateCounter()
         Thread(target=self.__ReadAsync).start()
-        
+
     def Stop(self):
-        self.__stopRequested = True
+        with self.__cond:
+            self.__stopRequested = True
+            self.__cond.notify_all()
 
-    # Return a frame if we have a new frame since this was last called.
-    # If there is no frame or if the frame is not new, return None.
-    def Read(self):
-        try:
-            self.__lock.acquire()
-            if not self.__lastFrameRead:
-                frame = self.__frame
-                self.__lastFrameRead = True
-                return frame
+    # Register a function returning the current PTZ state. It is called
+    # on the capture thread right after each frame is read.
+    def SetPtzStateSource(self, stateSource):
+        self.__ptzStateSource = stateSource
 
-            return None
+    def __Latest(self):
+        return self.__ring[self.__published % self.__depth]
+
+    def __LatestSeq(self):
+        latest = self.__Latest()
+        return latest.seq if latest is not None else 0
+
+    # Wait until ready() holds, the reader stops or timeout seconds pass
+    # (forever if timeout is None). Called with the condition held.
+    def __WaitUntil(self, ready, timeout):
+        self.__waiting += 1
+        try:
+            if timeout is None:
+                while not ready() and not self.__stopRequested:
+                    self.__cond.wait()
+            else:
+                deadline = time.time() + timeout
+                while not ready() and not self.__stopRequested:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.__cond.wait(remaining)
         finally:
-            self.__lock.release()
+            self.__waiting -= 1
+        return ready()
+
+    # Wait up to timeout seconds (forever if None) for a frame newer than
+    # the last one handed out, and return it as a Frame. Returns None on
+    # timeout or when the reader is stopped. Frames captured in between
+    # are skipped; the gap in seq tells the caller how many.
+    def WaitForFrame(self, timeout=None, lease=False):
+        with self.__cond:
+            if not self.__WaitUntil(lambda: self.__LatestSeq() > self.__lastReadSeq, timeout):
+                return None
+            latest = self.__Latest()
+            self.__lastReadSeq = latest.seq
+            return self.__Lease(latest, lease)
 
-    # Return the last frame read even if it has been retrieved before.
+    # Return the newest frame, whether or not it was handed out before.
     # Will return None if we never read a valid frame from the source.
-    # def ReadLastFrame(self):
-    #     return self.__frame
-        
+    def Latest(self, lease=False):
+        with self.__cond:
+            return self.__Lease(self.__Latest(), lease)
+
+    # Return the first frame in the ring captured after sequence number
+    # seq, waiting up to timeout seconds for one. If the frames right after
+    # seq have already dropped out of the ring, the oldest frame still held
+    # is returned instead.
+    def NextAfter(self, seq, timeout=None, lease=False):
+        with self.__cond:
+            if not self.__WaitUntil(lambda: self.__LatestSeq() > seq, timeout):
+                return None
+            frames = [frame for frame in self.__ring if frame is not None and frame.seq > seq]
+            return self.__Lease(min(frames, key=lambda frame: frame.seq), lease)
+
+    # Return the frame in the ring captured closest to the given time
+    def Nearest(self, timestamp, lease=False):
+        with self.__cond:
+            frames = [frame for frame in self.__ring if frame is not None]
+            if not frames:
+                return None
+            return self.__Lease(min(frames, key=lambda frame: abs(frame.timestamp - timestamp)), lease)
+
+    # Return a frame if we have a new frame since this was last called.
+    # If there is no frame or if the frame is not new, return None.
+    # With a timeout, wait up to that many seconds for a new frame.
+    def Read(self, timeout=0):
+        frame = self.WaitForFrame(timeout)
+        if frame is None:
+            return None
+        return frame.image
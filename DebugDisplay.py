@@ -0,0 +1,78 @@
+import Queue
+from threading import Thread, Condition
+
+import numpy as np
+import cv2
+
+from RealtimeInterval import RealtimeInterval
+
+''' DebugDisplay.py
+	Shows the preview window from its own thread so that repainting and
+	cv2.waitKey never hold up the control loop. The loop offers frames at
+	most maxFps times per second; the display thread shows the latest one
+	and queues the keys pressed in the window for the loop to pick up.
+'''
+
+# How long the display thread waits for key presses between frames
+KEY_WAIT_MS = 10
+
+
+class DebugDisplay:
+    def __init__(self, windowName, maxFps):
+        self.windowName = windowName
+        self.interval = RealtimeInterval(1.0 / maxFps, True)
+        self.keys = Queue.Queue()
+        self.__cond = Condition()
+        # show() fills __frame while the display thread paints __shown
+        self.__frame = None
+        self.__shown = None
+        self.__newFrame = False
+        self.__stopRequested = False
+        self.__thread = Thread(target=self.__DisplayAsync, name="display-thread")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    # Whether the display wants a frame now. Callers only need to annotate
+    # and show() a frame when this returns True.
+    def isDue(self):
+        return bool(self.interval.hasElapsed())
+
+    # Copy the frame for the display thread; the caller may reuse its buffer
+    # as soon as this returns
+    def show(self, image):
+        with self.__cond:
+            if self.__frame is None or self.__frame.shape != image.shape:
+                self.__frame = np.empty_like(image)
+            np.copyto(self.__frame, image)
+            self.__newFrame = True
+            self.__cond.notify()
+
+    # Next key pressed in the window, or -1 if there is none
+    def pollKey(self):
+        try:
+            return self.keys.get_nowait()
+        except Queue.Empty:
+            return -1
+
+    def stop(self):
+        with self.__cond:
+            self.__stopRequested = True
+            self.__cond.notify()
+        self.__thread.join(1.0)
+
+    def __DisplayAsync(self):
+        while True:
+            image = None
+            with self.__cond:
+                if self.__stopRequested:
+                    break
+                if self.__newFrame:
+                    self.__frame, self.__shown = self.__shown, self.__frame
+                    image = self.__shown
+                    self.__newFrame = False
+            if image is not None:
+                cv2.imshow(self.windowName, image)
+            keyPress = cv2.waitKey(KEY_WAIT_MS)
+            if keyPress != -1:
+                self.keys.put(keyPress & 0xFF)
+        cv2.destroyAllWindows()
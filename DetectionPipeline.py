@@ -0,0 +1,103 @@
+import ctypes
+import multiprocessing
+import Queue
+from collections import namedtuple
+
+import numpy as np
+
+from FaceDetector import FaceDetector
+
+''' DetectionPipeline.py
+	Runs face detection in a pool of worker processes so that capture,
+	detection and camera control overlap instead of taking turns on
+	one interpreter's GIL. Grayscale frames are written into a ring of
+	slots in shared memory and only the slot number travels through the
+	task queue. Each result carries the sequence number and capture
+	time of the frame it was computed from.
+
+	A slot stays owned by its result until release() is called, so the
+	caller can still read the frame the faces were found in.
+'''
+
+DetectionResult = namedtuple("DetectionResult", ["seq", "timestamp", "slot", "faces"])
+
+
+def detectionWorker(detectorCfg, buffer, shape, tasks, results):
+    frames = np.frombuffer(buffer, dtype=np.uint8).reshape(shape)
+    detector = FaceDetector(detectorCfg)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        slot, seq, timestamp = task
+        faces = detector.detect(frames[slot])
+        results.put(DetectionResult(seq, timestamp, slot, [tuple(box) for box in faces]))
+
+
+class DetectionPipeline:
+    def __init__(self, cfg, detectorCfg, frameShape):
+        slots = cfg["slots"]
+        height, width = frameShape[:2]
+        self.frameShape = (height, width)
+        self.buffer = multiprocessing.RawArray(ctypes.c_uint8, slots * height * width)
+        self.frames = np.frombuffer(self.buffer, dtype=np.uint8).reshape((slots, height, width))
+        self.freeSlots = range(slots)
+        self.lastSeq = -1
+        self.framesSkipped = 0
+        self.resultsDropped = 0
+
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.workers = []
+        for i in range(cfg["workers"]):
+            worker = multiprocessing.Process(target=detectionWorker, name="detector-{}".format(i),
+                                             args=(detectorCfg, self.buffer, self.frames.shape,
+                                                   self.tasks, self.results))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    # Queue a grayscale frame for detection. Returns False, and skips the
+    # frame, when every slot is still busy with an earlier frame.
+    def submit(self, gray, seq, timestamp):
+        if not self.freeSlots:
+            self.framesSkipped += 1
+            return False
+        slot = self.freeSlots.pop()
+        np.copyto(self.frames[slot], gray)
+        self.tasks.put((slot, seq, timestamp))
+        return True
+
+    # Return the finished results without blocking, oldest first. Results
+    # that arrive after a newer frame's result are released and dropped.
+    def poll(self):
+        ready = []
+        while True:
+            try:
+                ready.append(self.results.get_nowait())
+            except Queue.Empty:
+                break
+        ready.sort(key=lambda result: result.seq)
+
+        fresh = []
+        for result in ready:
+            if result.seq < self.lastSeq:
+                self.resultsDropped += 1
+                self.release(result)
+            else:
+                self.lastSeq = result.seq
+                fresh.append(result)
+        return fresh
+
+    # The frame a result was computed from, valid until it is released
+    def frame(self, result):
+        return self.frames[result.slot]
+
+    def release(self, result):
+        self.freeSlots.append(result.slot)
+
+    def stop(self):
+        for worker in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(1.0)
@@ -0,0 +1,213 @@
+from multiprocessing.pool import ThreadPool
+import threading
+
+import numpy as np
+import cv2
+
+''' FaceDetector.py
+	Loads the face detection model once and runs it against
+	grayscale frames. The detector backend can be swapped at runtime.
+
+	In ROI mode only a padded window around the last known face is
+	searched, with a full-frame scan every fullScanInterval frames,
+	whenever the face was lost, and whenever the window comes up empty.
+	A window only shows the faces near the last one, so faceCount, the
+	number of faces a caller should judge confidence by, keeps the count
+	of the last full-frame scan until the next one.
+
+	In tiled mode a full-frame scan is split into overlapping tiles that
+	are searched in parallel on a thread pool (detectMultiScale releases
+	the GIL). The tiles return the raw windows the cascade accepted,
+	before any grouping; each window is kept only by the tile whose core
+	holds its centre, so the overlaps count nothing twice, and the
+	windows of all tiles are then grouped into faces in one go, with
+	the same minNeighbors rule a single full-frame call applies.
+	Classifiers are not safe to share between threads, so every pool
+	thread loads its own copy of the backend.
+'''
+
+# Clustering tolerance detectMultiScale uses when grouping windows
+GROUP_EPS = 0.2
+
+
+class CascadeBackend:
+    def __init__(self, cfg):
+        self.cascadePath = cfg["cascadePath"]
+        self.scaleFactor = cfg["scaleFactor"]
+        self.minNeighbors = cfg["minNeighbors"]
+        self.minSize = tuple(cfg["minSize"])
+        self.classifier = cv2.CascadeClassifier(self.cascadePath)
+        if self.classifier.empty():
+            raise IOError("Could not load cascade '{}'".format(self.cascadePath))
+
+    def detect(self, gray):
+        return self.classifier.detectMultiScale(
+            gray,
+            scaleFactor=self.scaleFactor,
+            minNeighbors=self.minNeighbors,
+            minSize=self.minSize
+        )
+
+    # Every window the cascade accepts, without grouping neighbours
+    def candidates(self, gray):
+        return self.classifier.detectMultiScale(
+            gray,
+            scaleFactor=self.scaleFactor,
+            minNeighbors=0,
+            minSize=self.minSize
+        )
+
+    # Group candidate windows into faces the way detect() does
+    def group(self, boxes):
+        faces, weights = cv2.groupRectangles([list(box) for box in boxes], self.minNeighbors, GROUP_EPS)
+        return faces
+
+
+class FaceDetector:
+    # Backend factories by name. Each factory takes the detector config
+    # and returns an object with a detect(gray) method.
+    backends = {
+        "haar": CascadeBackend,
+    }
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.backend = None
+        self.backendName = None
+        self.setBackend(cfg.get("backend", "haar"))
+        self.roiEnabled = cfg.get("roiEnabled", False)
+        self.roiPadding = cfg.get("roiPadding", 1.0)
+        self.fullScanInterval = cfg.get("fullScanInterval", 15)
+        self.framesSinceFullScan = 0
+        self.lastRegion = None
+        # Faces seen by the last detect() call, and by the last full-frame scan
+        self.faceCount = 0
+        self.fullScanFaceCount = 0
+
+        self.tiledEnabled = cfg.get("tiledEnabled", False)
+        self.tileGrid = tuple(cfg.get("tileGrid", (2, 2)))
+        self.tileOverlap = cfg.get("tileOverlap", 200)
+        self.tileShape = None
+        self.tiles = []
+        self.tileCores = []
+        self.pool = None
+        self.threadBackends = threading.local()
+        if self.tiledEnabled:
+            self.pool = ThreadPool(cfg.get("tileWorkers", self.tileGrid[0] * self.tileGrid[1]))
+
+    @classmethod
+    def registerBackend(cls, name, factory):
+        cls.backends[name] = factory
+
+    def setBackend(self, name, cfg=None):
+        if name not in self.backends:
+            raise ValueError("Unknown detector backend '{}'".format(name))
+        if cfg is not None:
+            self.cfg = cfg
+        self.backend = self.backends[name](self.cfg)
+        self.backendName = name
+        self.backendGeneration = getattr(self, "backendGeneration", 0) + 1
+
+    # Return the (x, y, w, h) boxes of the faces found in a grayscale frame.
+    # When a Face is given and ROI mode is on, search around it first.
+    def detect(self, gray, face=None):
+        if self.roiEnabled and face is not None and face.visible \
+                and self.framesSinceFullScan < self.fullScanInterval:
+            region = self.regionAround(face, gray.shape)
+            if region is not None:
+                (x0, y0, x1, y1) = region
+                self.framesSinceFullScan += 1
+                self.lastRegion = region
+                # Slicing gives a view into the frame, no pixels are copied
+                faces = self.backend.detect(gray[y0:y1, x0:x1])
+                if len(faces):
+                    self.faceCount = max(len(faces), self.fullScanFaceCount)
+                    return faces + (x0, y0, 0, 0)
+
+        self.framesSinceFullScan = 0
+        self.lastRegion = None
+        if self.tiledEnabled:
+            faces = self.detectTiled(gray)
+        else:
+            faces = self.backend.detect(gray)
+        self.faceCount = self.fullScanFaceCount = len(faces)
+        return faces
+
+    # Backends without candidates() and group() have their detections
+    # from each tile kept by the same centre rule, but not regrouped
+    def detectTiled(self, gray):
+        if self.tileShape != gray.shape:
+            self.tiles, self.tileCores = self.tileRegions(gray.shape)
+            self.tileShape = gray.shape
+
+        def detectTile(tile):
+            ((x0, y0, x1, y1), (cx0, cy0, cx1, cy1)) = tile
+            backend = self.threadBackend()
+            if hasattr(backend, "candidates"):
+                boxes = backend.candidates(gray[y0:y1, x0:x1])
+            else:
+                boxes = backend.detect(gray[y0:y1, x0:x1])
+            if not len(boxes):
+                return []
+            boxes = boxes + (x0, y0, 0, 0)
+            centerX = boxes[:, 0] + boxes[:, 2] // 2
+            centerY = boxes[:, 1] + boxes[:, 3] // 2
+            owned = (centerX >= cx0) & (centerX < cx1) & (centerY >= cy0) & (centerY < cy1)
+            return boxes[owned]
+
+        found = [boxes for boxes in self.pool.map(detectTile, zip(self.tiles, self.tileCores)) if len(boxes)]
+        if not found:
+            return ()
+        boxes = np.concatenate(found)
+        if hasattr(self.backend, "group"):
+            faces = self.backend.group(boxes)
+            return faces if len(faces) else ()
+        return boxes
+
+    # The calling pool thread's own instance of the current backend
+    def threadBackend(self):
+        local = self.threadBackends
+        if getattr(local, "generation", None) != self.backendGeneration:
+            local.backend = self.backends[self.backendName](self.cfg)
+            local.generation = self.backendGeneration
+        return local.backend
+
+    # Split the frame into a grid of tiles that overlap by tileOverlap pixels,
+    # so any face up to that size lies entirely within the tile whose core,
+    # the grid cell without the overlap, holds its centre. Returns the tiles
+    # and their cores, both as (x0, y0, x1, y1). The cascade's windows run
+    # somewhat larger than the faces, so tileOverlap needs headroom above
+    # the largest face expected.
+    def tileRegions(self, shape):
+        frameHeight, frameWidth = shape[:2]
+        columns, rows = self.tileGrid
+        tileWidth = int(np.ceil(frameWidth / float(columns)))
+        tileHeight = int(np.ceil(frameHeight / float(rows)))
+        halfOverlap = self.tileOverlap // 2
+        regions = []
+        cores = []
+        for row in range(rows):
+            for column in range(columns):
+                cx0 = column * tileWidth
+                cy0 = row * tileHeight
+                cx1 = min(frameWidth, cx0 + tileWidth)
+                cy1 = min(frameHeight, cy0 + tileHeight)
+                regions.append((max(0, cx0 - halfOverlap), max(0, cy0 - halfOverlap),
+                                min(frameWidth, cx1 + halfOverlap), min(frameHeight, cy1 + halfOverlap)))
+                cores.append((cx0, cy0, cx1, cy1))
+        return regions, cores
+
+    # Padded (x0, y0, x1, y1) window around the face, clipped to the frame
+    def regionAround(self, face, shape):
+        if face.width <= 0 or face.height <= 0:
+            return None
+        frameHeight, frameWidth = shape[:2]
+        halfWidth = int(face.width * (0.5 + self.roiPadding))
+        halfHeight = int(face.height * (0.5 + self.roiPadding))
+        x0 = max(0, int(face.xcenter) - halfWidth)
+        y0 = max(0, int(face.ycenter) - halfHeight)
+        x1 = min(frameWidth, int(face.xcenter) + halfWidth)
+        y1 = min(frameHeight, int(face.ycenter) + halfHeight)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return (x0, y0, x1, y1)
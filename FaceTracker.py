@@ -0,0 +1,87 @@
+import cv2
+
+''' FaceTracker.py
+	Follows a face between detector runs by matching the template
+	taken at the last detection inside a small window around its
+	previous position. Matching runs on a downscaled copy of the
+	window so it costs a fraction of a cascade pass. Only one face is
+	followed, but the number of faces the detection found is kept so
+	tracked frames are judged by the same confidence as detected ones.
+'''
+
+
+class FaceTracker:
+    def __init__(self, cfg):
+        self.enabled = cfg.get("enabled", True)
+        self.detectInterval = cfg["detectInterval"]
+        self.searchPadding = cfg["searchPadding"]
+        self.minScore = cfg["minScore"]
+        self.scale = cfg.get("scale", 0.5)
+        self.stop()
+
+    def stop(self):
+        self.template = None
+        self.box = None
+        self.score = 0.0
+        self.faceCount = 0
+        self.framesSinceDetection = 0
+
+    def isTracking(self):
+        return self.template is not None
+
+    # How far the last match is from a perfect one, 0 (none) to 1 (lost)
+    def drift(self):
+        return 1.0 - self.score if self.isTracking() else 1.0
+
+    # Whether the caller should run the full detector on this frame
+    def needsDetection(self):
+        return not self.enabled \
+            or not self.isTracking() \
+            or self.framesSinceDetection >= self.detectInterval \
+            or self.score < self.minScore
+
+    # Take a new template from a detector result that found faceCount faces
+    def start(self, gray, box, faceCount=1):
+        (x, y, w, h) = [int(v) for v in box]
+        patch = gray[y:y + h, x:x + w]
+        if patch.size == 0:
+            self.stop()
+            return
+        self.template = cv2.resize(patch, None, fx=self.scale, fy=self.scale,
+                                   interpolation=cv2.INTER_AREA)
+        self.box = (x, y, w, h)
+        self.score = 1.0
+        self.faceCount = faceCount
+        self.framesSinceDetection = 0
+
+    # Follow the face into this frame. Returns the new (x, y, w, h) box,
+    # or None when the match is too weak to be trusted.
+    def update(self, gray):
+        if not self.isTracking():
+            return None
+        self.framesSinceDetection += 1
+
+        (x, y, w, h) = self.box
+        frameHeight, frameWidth = gray.shape[:2]
+        padX = int(w * self.searchPadding)
+        padY = int(h * self.searchPadding)
+        x0 = max(0, x - padX)
+        y0 = max(0, y - padY)
+        x1 = min(frameWidth, x + w + padX)
+        y1 = min(frameHeight, y + h + padY)
+
+        window = cv2.resize(gray[y0:y1, x0:x1], None, fx=self.scale, fy=self.scale,
+                            interpolation=cv2.INTER_AREA)
+        templateHeight, templateWidth = self.template.shape[:2]
+        if window.shape[0] < templateHeight or window.shape[1] < templateWidth:
+            self.score = 0.0
+            return None
+
+        result = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, self.score, _, location = cv2.minMaxLoc(result)
+        if self.score < self.minScore:
+            return None
+
+        self.box = (x0 + int(location[0] / self.scale),
+                    y0 + int(location[1] / self.scale), w, h)
+        return self.box
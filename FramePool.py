@@ -0,0 +1,42 @@
+''' FramePool.py
+	A pool of reusable image buffers with reference counts. A buffer is
+	handed out again only once every holder has released it, so a frame
+	that is still referenced is never overwritten. When every buffer is
+	busy the pool grows by one instead of blocking the caller.
+
+	The pool does no locking of its own; callers must serialize access.
+'''
+
+
+class FramePool:
+    def __init__(self, size):
+        self.buffers = [None] * size
+        self.refs = [0] * size
+        self.grown = 0
+
+    # Reserve a free buffer and return (index, buffer). The buffer is None
+    # until the first image stored for that index.
+    def acquire(self):
+        for index, refs in enumerate(self.refs):
+            if refs == 0:
+                self.refs[index] = 1
+                return index, self.buffers[index]
+        self.buffers.append(None)
+        self.refs.append(1)
+        self.grown += 1
+        return len(self.buffers) - 1, None
+
+    # Remember the array the source actually filled, which is a new one
+    # when the buffer was missing or had the wrong shape
+    def store(self, index, image):
+        self.buffers[index] = image
+
+    def addRef(self, index):
+        self.refs[index] += 1
+
+    def release(self, index):
+        if self.refs[index] > 0:
+            self.refs[index] -= 1
+
+    def leased(self):
+        return sum(1 for refs in self.refs if refs > 0)
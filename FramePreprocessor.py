@@ -0,0 +1,128 @@
+import numpy as np
+import cv2
+
+''' FramePreprocessor.py
+	Scales captured frames down to the processing width and converts
+	them to grayscale into buffers it owns, so the steady state
+	allocates nothing per frame. The buffers are overwritten by the
+	next call; copy them if a frame has to outlive the loop iteration.
+
+	Frames may arrive as BGR images or as raw YUYV buffers. For YUYV the
+	luma plane is copied out of the buffer once, into an owned
+	contiguous buffer, so detection never waits on a colour conversion
+	and OpenCV never has to copy a strided view behind our back; the
+	BGR image is only built when the frame is annotated for display.
+
+	MJPEG frames arrive still compressed and are decoded straight to
+	grayscale at 1/2, 1/4 or 1/8 scale, whichever is the smallest that
+	still covers the processing width, which is far cheaper than a
+	full-size decode followed by a resize.
+'''
+
+PIXEL_FORMAT_BGR = "bgr"
+PIXEL_FORMAT_YUYV = "yuyv"
+PIXEL_FORMAT_MJPEG = "mjpeg"
+
+# imdecode flags by reduction factor
+REDUCED_GRAYSCALE = {1: cv2.IMREAD_GRAYSCALE,
+                     2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                     4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                     8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+REDUCED_COLOR = {1: cv2.IMREAD_COLOR,
+                 2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4,
+                 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+class FramePreprocessor:
+    def __init__(self, width, annotate=False, pixelFormat=PIXEL_FORMAT_BGR, sourceSize=None):
+        self.width = width
+        self.annotate = annotate
+        self.pixelFormat = pixelFormat
+        self.sourceSize = sourceSize
+        self.sourceShape = None
+        self.size = None
+        self.color = None
+        self.gray = None
+        self.fullColor = None
+        self.luma = None
+        self.reduction = 1
+        if pixelFormat == PIXEL_FORMAT_MJPEG:
+            self.reduction = self.reductionFor(sourceSize[0])
+
+    # Largest JPEG decode reduction that keeps at least the processing width
+    def reductionFor(self, sourceWidth):
+        for reduction in (8, 4, 2):
+            if sourceWidth // reduction >= self.width:
+                return reduction
+        return 1
+
+    # Work out the output size once per source resolution, keeping the
+    # source aspect ratio, and allocate the output buffers for it
+    def reset(self, shape):
+        sourceHeight, sourceWidth = shape[:2]
+        height = int(round(sourceHeight * self.width / float(sourceWidth)))
+        self.sourceShape = shape
+        self.size = (self.width, height)
+        self.color = np.empty((height, self.width, 3), np.uint8)
+        self.gray = np.empty((height, self.width), np.uint8)
+        self.fullColor = None
+        self.luma = None
+        if self.pixelFormat == PIXEL_FORMAT_YUYV:
+            self.fullColor = np.empty((sourceHeight, sourceWidth, 3), np.uint8)
+            # At the processing width the luma plane goes straight into gray
+            if sourceWidth == self.width:
+                self.luma = self.gray
+            else:
+                self.luma = np.empty((sourceHeight, sourceWidth), np.uint8)
+
+    # View a raw YUYV buffer as height x width pixels of (Y, U or V)
+    def yuyvView(self, raw):
+        if raw.ndim == 3 and raw.shape[2] == 2:
+            return raw
+        sourceWidth, sourceHeight = self.sourceSize
+        return raw.reshape(sourceHeight, sourceWidth, 2)
+
+    # Returns the scaled colour frame and its grayscale version. For YUYV
+    # and MJPEG sources the colour frame is only filled in when annotating.
+    # The grayscale frame is None when a compressed frame cannot be decoded.
+    def process(self, raw):
+        if self.pixelFormat == PIXEL_FORMAT_YUYV:
+            return self.processYuyv(self.yuyvView(raw))
+        if self.pixelFormat == PIXEL_FORMAT_MJPEG:
+            return self.processMjpeg(raw)
+
+        if self.sourceShape != raw.shape:
+            self.reset(raw.shape)
+        cv2.resize(raw, self.size, dst=self.color, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.color, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        return self.color, self.gray
+
+    def processYuyv(self, yuyv):
+        if self.sourceShape != yuyv.shape:
+            self.reset(yuyv.shape)
+        cv2.extractChannel(yuyv, 0, dst=self.luma)
+        if self.luma is not self.gray:
+            cv2.resize(self.luma, self.size, dst=self.gray, interpolation=cv2.INTER_AREA)
+
+        if self.annotate:
+            cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV, dst=self.fullColor)
+            cv2.resize(self.fullColor, self.size, dst=self.color, interpolation=cv2.INTER_AREA)
+        return self.color, self.gray
+
+    def processMjpeg(self, raw):
+        decoded = cv2.imdecode(raw, REDUCED_GRAYSCALE[self.reduction])
+        if decoded is None:
+            return self.color, None
+        if self.sourceShape != decoded.shape:
+            self.reset(decoded.shape)
+        if decoded.shape[1] == self.width:
+            gray = decoded
+        else:
+            gray = cv2.resize(decoded, self.size, dst=self.gray, interpolation=cv2.INTER_AREA)
+
+        if self.annotate:
+            color = cv2.imdecode(raw, REDUCED_COLOR[self.reduction])
+            if color is not None:
+                cv2.resize(color, self.size, dst=self.color, interpolation=cv2.INTER_AREA)
+        return self.color, gray
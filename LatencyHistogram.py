@@ -0,0 +1,117 @@
+import math
+
+''' LatencyHistogram.py
+	Records stage latencies into HDR-style histograms: values are counted
+	in microseconds in buckets that double in width with each power of
+	two but are split into HALF_SUB_BUCKETS linear steps, so every
+	recorded value keeps about two significant digits whatever its
+	magnitude. Recording is a couple of integer operations and never
+	allocates, and percentiles are read back by walking the fixed
+	bucket array.
+
+	LatencyProfiler keeps one histogram per named stage and formats
+	p50/p95/p99/max for all of them. A histogram expects to be recorded
+	into from one thread at a time.
+'''
+
+# Values below SUB_BUCKETS are exact; above, each power of two is split
+# into HALF_SUB_BUCKETS steps, which keeps the error under about 3%
+SUB_BUCKET_BITS = 6
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS // 2
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    def __init__(self, maxSeconds=60.0):
+        self.maxMicros = int(maxSeconds * 1e6)
+        self.counts = [0] * (self.indexFor(self.maxMicros) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.largest = 0
+
+    # Bucket for a value in microseconds. Values below SUB_BUCKETS are
+    # counted exactly; above that, each power of two gets HALF_SUB_BUCKETS
+    # buckets of equal width.
+    @staticmethod
+    def indexFor(micros):
+        if micros < SUB_BUCKETS:
+            return micros
+        shift = micros.bit_length() - SUB_BUCKET_BITS
+        return SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + (micros >> shift) - HALF_SUB_BUCKETS
+
+    # Largest value in microseconds that falls into a bucket
+    @staticmethod
+    def highestValueAt(index):
+        if index < SUB_BUCKETS:
+            return index
+        shift = (index - SUB_BUCKETS) // HALF_SUB_BUCKETS + 1
+        subBucket = (index - SUB_BUCKETS) % HALF_SUB_BUCKETS + HALF_SUB_BUCKETS
+        return ((subBucket + 1) << shift) - 1
+
+    def record(self, seconds):
+        micros = min(max(int(seconds * 1e6), 0), self.maxMicros)
+        self.counts[self.indexFor(micros)] += 1
+        self.count += 1
+        if micros > self.largest:
+            self.largest = micros
+
+    # Latency in seconds that the given percentage of recorded values
+    # does not exceed, or 0 if nothing was recorded
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        target = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.highestValueAt(index), self.largest) / 1e6
+        return self.largest / 1e6
+
+    def max(self):
+        return self.largest / 1e6
+
+    # Count, percentiles and max, with the latencies in seconds
+    def summary(self):
+        summary = {"count": self.count, "max": self.max()}
+        for percent in PERCENTILES:
+            summary["p{}".format(percent)] = self.percentile(percent)
+        return summary
+
+
+class LatencyProfiler:
+    def __init__(self, maxSeconds=60.0):
+        self.maxSeconds = maxSeconds
+        self.histograms = {}
+
+    def histogram(self, name):
+        if name not in self.histograms:
+            self.histograms[name] = LatencyHistogram(self.maxSeconds)
+        return self.histograms[name]
+
+    def record(self, name, seconds):
+        self.histogram(name).record(seconds)
+
+    # Summaries of every stage, keyed by stage name
+    def summary(self):
+        return dict((name, histogram.summary()) for name, histogram in self.histograms.items())
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    # One line per stage with its latencies in milliseconds
+    def report(self):
+        lines = []
+        for name in sorted(self.histograms):
+            summary = self.histograms[name].summary()
+            lines.append("{0:<24} n={1:<7} p50={2:7.2f} p95={3:7.2f} p99={4:7.2f} max={5:7.2f} ms".format(
+                name, summary["count"], summary["p50"] * 1e3, summary["p95"] * 1e3,
+                summary["p99"] * 1e3, summary["max"] * 1e3))
+        return lines
@@ -0,0 +1,122 @@
+import sys
+import time
+from collections import deque
+from threading import Thread, Condition
+
+''' LogWriterAsync.py
+	Keeps logging off the control loop. A log call appends a fixed-format
+	record (time, level, subsystem, format string, arguments) to an
+	in-memory ring and returns; the message is only formatted and written
+	by a background thread, which flushes the ring in batches every
+	flushSeconds. If the writer falls behind, the oldest records are
+	overwritten and counted in recordsDropped.
+
+	Each subsystem gets a Logger with its own level. A call below that
+	level is a single integer comparison and never touches the ring.
+'''
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+class Logger:
+    def __init__(self, writer, name, level):
+        self.writer = writer
+        self.name = name
+        self.level = level
+
+    def isEnabledFor(self, level):
+        return level >= self.level
+
+    # The message is fmt.format(*args), built later on the writer thread
+    def debug(self, fmt, *args):
+        if self.level <= DEBUG:
+            self.writer.write(DEBUG, self.name, fmt, args)
+
+    def info(self, fmt, *args):
+        if self.level <= INFO:
+            self.writer.write(INFO, self.name, fmt, args)
+
+    def warning(self, fmt, *args):
+        if self.level <= WARNING:
+            self.writer.write(WARNING, self.name, fmt, args)
+
+    def error(self, fmt, *args):
+        if self.level <= ERROR:
+            self.writer.write(ERROR, self.name, fmt, args)
+
+
+class LogWriterAsync:
+    def __init__(self, cfg, stream=sys.stdout):
+        self.stream = stream
+        self.flushSeconds = cfg["flushSeconds"]
+        self.defaultLevel = LEVELS[cfg["level"]]
+        self.levels = dict((name, LEVELS[level]) for name, level in cfg["levels"].items())
+        self.recordsDropped = 0
+        self.__loggers = {}
+        self.__records = deque(maxlen=cfg["bufferRecords"])
+        self.__cond = Condition()
+        self.__stopRequested = False
+        self.__thread = Thread(target=self.__FlushAsync, name="log-thread")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    # Logger for a subsystem, at the level configured for it
+    def logger(self, name):
+        if name not in self.__loggers:
+            self.__loggers[name] = Logger(self, name, self.levels.get(name, self.defaultLevel))
+        return self.__loggers[name]
+
+    def setLevel(self, name, level):
+        self.levels[name] = level
+        self.logger(name).level = level
+
+    def write(self, level, name, fmt, args):
+        record = (time.time(), level, name, fmt, args)
+        with self.__cond:
+            if len(self.__records) == self.__records.maxlen:
+                self.recordsDropped += 1
+            self.__records.append(record)
+
+    # Write out everything logged so far from the calling thread
+    def flush(self):
+        with self.__cond:
+            records = list(self.__records)
+            self.__records.clear()
+        self.__writeBatch(records)
+
+    def stop(self):
+        with self.__cond:
+            self.__stopRequested = True
+            self.__cond.notify()
+        self.__thread.join(1.0)
+        self.flush()
+
+    def __writeBatch(self, records):
+        if not records:
+            return
+        lines = []
+        for timestamp, level, name, fmt, args in records:
+            try:
+                message = fmt.format(*args)
+            except (IndexError, KeyError, ValueError):
+                message = "{} {}".format(fmt, args)
+            lines.append("{0:.3f} {1:<7} {2}: {3}\n".format(timestamp, LEVEL_NAMES[level], name, message))
+        self.stream.write("".join(lines))
+        self.stream.flush()
+
+    def __FlushAsync(self):
+        while True:
+            with self.__cond:
+                if not self.__stopRequested:
+                    self.__cond.wait(self.flushSeconds)
+                if self.__stopRequested:
+                    break
+                records = list(self.__records)
+                self.__records.clear()
+            self.__writeBatch(records)
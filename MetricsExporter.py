@@ -0,0 +1,86 @@
+import BaseHTTPServer
+from threading import Thread
+
+from LatencyHistogram import PERCENTILES
+
+''' MetricsExporter.py
+	Serves metrics in the Prometheus text format over HTTP from its own
+	thread. Nothing is pushed to the exporter: on every scrape it calls
+	the collect function it was given, which reads the counters and
+	histograms the frame loop keeps anyway. Those reads take no locks,
+	so a scrape never holds up the loop; a value may be one frame out
+	of date with its neighbours, which does not matter for monitoring.
+
+	collect() returns a list of (name, kind, help, samples) tuples,
+	where kind is a Prometheus metric type and samples is a list of
+	(labels, value) pairs with labels as a dict.
+'''
+
+GAUGE = "gauge"
+COUNTER = "counter"
+SUMMARY = "summary"
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def formatLabels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(key, str(labels[key]).replace('"', '\\"'))
+                          for key in sorted(labels)) + "}"
+
+
+def formatMetrics(families):
+    lines = []
+    for name, kind, help, samples in families:
+        lines.append("# HELP {0} {1}".format(name, help))
+        lines.append("# TYPE {0} {1}".format(name, kind))
+        for labels, value in samples:
+            sampleName = name
+            # Summaries carry their count as a separate series
+            if kind == SUMMARY and "quantile" not in labels:
+                sampleName = name + "_count"
+            lines.append("{0}{1} {2!r}".format(sampleName, formatLabels(labels), float(value)))
+    return "\n".join(lines) + "\n"
+
+
+# Family for a set of LatencyHistogram summaries keyed by label value
+def summaryFamily(name, help, label, summaries, percentiles=PERCENTILES):
+    samples = []
+    for key in sorted(summaries):
+        summary = summaries[key]
+        for percent in percentiles:
+            samples.append(({label: key, "quantile": percent / 100.0}, summary["p{}".format(percent)]))
+        samples.append(({label: key}, summary["count"]))
+    return (name, SUMMARY, help, samples)
+
+
+class MetricsExporter:
+    def __init__(self, cfg, collect):
+        self.collect = collect
+        exporter = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = formatMetrics(exporter.collect())
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # Keep scrapes out of the console
+            def log_message(self, format, *args):
+                pass
+
+        self.server = BaseHTTPServer.HTTPServer((cfg["host"], cfg["port"]), Handler)
+        self.thread = Thread(target=self.server.serve_forever, name="metrics-thread")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
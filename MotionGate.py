@@ -0,0 +1,61 @@
+import numpy as np
+import cv2
+
+''' MotionGate.py
+	Decides whether a frame is worth running face detection on. Each
+	frame is shrunk to a thumbnail and compared against a running
+	average of the scene; when too few pixels differ, the caller can
+	reuse its previous result. Detection is still forced every
+	maxSkipFrames frames so a slow drift cannot go unnoticed forever.
+'''
+
+
+class MotionGate:
+    def __init__(self, cfg):
+        self.enabled = cfg.get("enabled", True)
+        self.sampleWidth = cfg["sampleWidth"]
+        self.pixelThreshold = cfg["pixelThreshold"]
+        self.changedFraction = cfg["changedFraction"]
+        self.learningRate = cfg["learningRate"]
+        self.maxSkipFrames = cfg["maxSkipFrames"]
+        self.framesSkipped = 0
+        self.skippedSinceDetection = 0
+        self.shape = None
+
+    def reset(self, shape):
+        height, width = shape[:2]
+        sampleHeight = max(1, int(round(height * self.sampleWidth / float(width))))
+        self.shape = shape
+        self.sampleSize = (self.sampleWidth, sampleHeight)
+        self.sample = np.empty((sampleHeight, self.sampleWidth), np.uint8)
+        self.background = None
+        self.background8 = np.empty_like(self.sample)
+        self.difference = np.empty_like(self.sample)
+        self.mask = np.empty_like(self.sample)
+        self.minChangedPixels = max(1, int(self.changedFraction * self.sample.size))
+
+    # Whether the scene changed enough since recent frames to need detection
+    def changed(self, gray):
+        if not self.enabled:
+            return True
+        if self.shape != gray.shape:
+            self.reset(gray.shape)
+
+        cv2.resize(gray, self.sampleSize, dst=self.sample, interpolation=cv2.INTER_AREA)
+        if self.background is None:
+            self.background = self.sample.astype(np.float32)
+            return True
+
+        cv2.convertScaleAbs(self.background, dst=self.background8)
+        cv2.absdiff(self.sample, self.background8, dst=self.difference)
+        cv2.threshold(self.difference, self.pixelThreshold, 255, cv2.THRESH_BINARY, dst=self.mask)
+        cv2.accumulateWeighted(self.sample, self.background, self.learningRate)
+
+        if cv2.countNonZero(self.mask) >= self.minChangedPixels \
+                or self.skippedSinceDetection >= self.maxSkipFrames:
+            self.skippedSinceDetection = 0
+            return True
+
+        self.skippedSinceDetection += 1
+        self.framesSkipped += 1
+        return False
@@ -0,0 +1,31 @@
+import time
+
+''' StalenessPolicy.py
+	Keeps the tracker from acting on old news. A frame that is already
+	older than maxFrameAgeSeconds when the loop picks it up is dropped
+	before detection, and a detection result whose frame has aged past
+	the same bound by the time it is ready is discarded before it can
+	drive the camera. Both cases are counted.
+'''
+
+
+class StalenessPolicy:
+    def __init__(self, cfg):
+        self.maxAge = cfg["maxFrameAgeSeconds"]
+        self.framesDropped = 0
+        self.resultsDiscarded = 0
+
+    # Whether a frame captured at this time is still fresh enough to process
+    def admitFrame(self, timestamp):
+        if time.time() - timestamp <= self.maxAge:
+            return True
+        self.framesDropped += 1
+        return False
+
+    # Whether a result computed from a frame captured at this time is still
+    # fresh enough to act on
+    def admitResult(self, timestamp):
+        if time.time() - timestamp <= self.maxAge:
+            return True
+        self.resultsDiscarded += 1
+        return False
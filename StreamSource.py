@@ -0,0 +1,102 @@
+import os
+import time
+
+import cv2
+
+''' StreamSource.py
+	Opens a network stream (RTSP/HTTP) or a video file through FFmpeg
+	with as little buffering as the backend allows, and behaves like a
+	cv2.VideoCapture towards CameraReaderAsync.
+
+	Frames that arrive more than maxLatencySeconds behind the freshest
+	frame seen so far are grabbed and thrown away without decoding, so
+	a backlog in the network or the decoder is skipped instead of being
+	played out late. Latency is judged from the stream timestamps: the
+	smallest gap between arrival time and stream time is taken as the
+	best case, and each frame is compared with it. The best case is
+	allowed to creep up by BASELINE_DRIFT seconds per second, so a
+	stream clock running slow against ours is not mistaken for a
+	growing backlog. At most maxSkipFrames frames are skipped per grab;
+	past that the backlog is taken as the new normal, the frame is
+	returned and the best case is reset to it.
+
+	When no frame arrives for stallSeconds the stream is reopened.
+'''
+
+# How fast the best-case offset may rise, in seconds per second; covers
+# clock drift well beyond what real encoders show (2000 ppm)
+BASELINE_DRIFT = 0.002
+
+
+class StreamSource:
+    def __init__(self, url, cfg):
+        self.url = url
+        self.maxLatency = cfg["maxLatencySeconds"]
+        self.stallSeconds = cfg["stallSeconds"]
+        self.captureOptions = cfg["captureOptions"]
+        self.maxSkipFrames = cfg["maxSkipFrames"]
+        self.capture = None
+        self.framesDropped = 0
+        self.reconnects = 0
+        self.open()
+
+    def open(self):
+        # Read by the FFmpeg backend when the capture is opened
+        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = self.captureOptions
+        self.capture = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.lastFrameTime = time.time()
+        self.bestOffset = None
+
+    def reconnect(self):
+        print "WARNING: Stream '{}' stalled, reconnecting".format(self.url)
+        self.capture.release()
+        self.reconnects += 1
+        self.open()
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    # Grab the next frame that is fresh enough, skipping stale ones
+    def grab(self):
+        skipped = 0
+        while True:
+            if not self.capture.isOpened() or not self.capture.grab():
+                if time.time() - self.lastFrameTime > self.stallSeconds:
+                    self.reconnect()
+                else:
+                    time.sleep(0.01)
+                return False
+
+            now = time.time()
+            offset = now - self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if self.bestOffset is None:
+                self.bestOffset = offset
+            else:
+                self.bestOffset = min(offset, self.bestOffset + BASELINE_DRIFT * (now - self.lastFrameTime))
+            self.lastFrameTime = now
+            if offset - self.bestOffset <= self.maxLatency:
+                return True
+            if skipped >= self.maxSkipFrames:
+                # Could not catch up; start judging from here
+                self.bestOffset = offset
+                return True
+            skipped += 1
+            self.framesDropped += 1
+
+    def retrieve(self, image=None):
+        return self.capture.retrieve(image)
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def release(self):
+        self.capture.release()
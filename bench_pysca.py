@@ -0,0 +1,70 @@
+import timeit
+
+import pysca
+from pysca import Packet
+
+''' bench_pysca.py
+	Compares the cost of encoding the VISCA commands cambot sends most
+	often through Packet.from_parts with the compiled packet builders,
+	and of handling a response as a Packet with the decoded Response.
+	No camera or serial port is needed.
+
+	python bench_pysca.py
+'''
+
+ROUNDS = 20000
+DEVICE = 1
+# An ACK from device 1, whose fields are read as the reader thread and Device.send do
+RESPONSE = '\x90\x41\xff'
+
+
+def fromPartsDrive():
+    Packet.from_parts(0, DEVICE, pysca.VISCA_COMMAND, pysca.VISCA_CATEGORY_PAN_TILTER, pysca.VISCA_PT_DRIVE,
+                      10, 4, pysca.VISCA_PT_DRIVE_HORIZ_LEFT, pysca.VISCA_PT_DRIVE_VERT_UP)
+
+
+def compiledDrive():
+    pysca.drive_packet(DEVICE, 10, 4, pysca.VISCA_PT_DRIVE_HORIZ_LEFT, pysca.VISCA_PT_DRIVE_VERT_UP)
+
+
+def fromPartsPosition():
+    Packet.from_parts(0, DEVICE, pysca.VISCA_COMMAND, pysca.VISCA_CATEGORY_PAN_TILTER,
+                      pysca.VISCA_PT_ABSOLUTE_POSITION, 5, 5,
+                      Packet.int_to_bytes(0x0123, 4), Packet.int_to_bytes(0x0045, 4))
+
+
+def compiledPosition():
+    pysca.position_packet(DEVICE, 5, 5, 0x0123, 0x0045)
+
+
+def fromPartsZoom():
+    Packet.from_parts(0, DEVICE, pysca.VISCA_COMMAND, pysca.VISCA_CATEGORY_CAMERA, pysca.VISCA_ZOOM_VALUE,
+                      Packet.int_to_bytes(0x1000, 4))
+
+
+def compiledZoom():
+    pysca.zoom_packet(DEVICE, 0x1000)
+
+
+def packetResponse():
+    p = Packet(RESPONSE)
+    p.header, p.sender, p.type, p.socket, p.type, p.socket
+
+
+def decodedResponse():
+    p = pysca.Response(RESPONSE)
+    p.header, p.sender, p.type, p.socket, p.type, p.socket
+
+
+def microseconds(fn):
+    return min(timeit.repeat(fn, number=ROUNDS, repeat=3)) / ROUNDS * 1e6
+
+
+for name, slow, fast in (("drive", fromPartsDrive, compiledDrive),
+                         ("position", fromPartsPosition, compiledPosition),
+                         ("zoom", fromPartsZoom, compiledZoom),
+                         ("response", packetResponse, decodedResponse)):
+    before = microseconds(slow)
+    after = microseconds(fast)
+    print "{0:<10} before {1:7.2f} us   after {2:7.2f} us   {3:5.1f}x".format(
+        name, before, after, before / after)
@@ -5,7 +5,6 @@ import math
 import numpy as np
 from cv2 import cv2
 from imutils import face_utils
-import imutils
 
 import argparse
 import json
@@ -16,7 +15,18 @@ sys.path.append('../pysca')
 from pysca import pysca
 
 from RealtimeInterval import RealtimeInterval
+from LogWriterAsync import LogWriterAsync
+from LatencyHistogram import LatencyProfiler
+from MetricsExporter import MetricsExporter, GAUGE, COUNTER, summaryFamily
 import CameraReaderAsync
+from StreamSource import StreamSource
+from StalenessPolicy import StalenessPolicy
+from DebugDisplay import DebugDisplay
+from FaceDetector import FaceDetector
+from FaceTracker import FaceTracker
+from DetectionPipeline import DetectionPipeline
+from MotionGate import MotionGate
+from FramePreprocessor import FramePreprocessor, PIXEL_FORMAT_BGR, PIXEL_FORMAT_YUYV, PIXEL_FORMAT_MJPEG
 from WeightedFramerateCounter import WeightedFramerateCounter
 
 ''' cambot.py
@@ -44,17 +54,21 @@ class Face():
     firstSeenTime = 0
     xcenter = -1
     ycenter = -1
+    width = 0
+    height = 0
 
     def __init__(self, cfg):
         self._recentThresholdSeconds = cfg["recentThresholdSeconds"]
 
-    def found(self, xcenter, ycenter):
+    def found(self, xcenter, ycenter, width=0, height=0):
         now = time.time()
         if not self.visible:
             self.firstSeenTime = now
         self.lastSeenTime = now
         self.xcenter = xcenter
         self.ycenter = ycenter
+        self.width = width
+        self.height = height
         self.visible = True
         self.recentlyVisible = True
         self.didDisappear = False
@@ -95,7 +109,8 @@ class Subject():
     isFarDown = False
     debug_mode = False
 
-    def __init__(self, cfg, debug_mode=False):
+    def __init__(self, cfg, log, debug_mode=False):
+        self.log = log
         self.centeredPercentVariance = cfg["centeredPercentVariance"]
         self.offCenterPercentVariance = cfg["offCenterPercentVariance"]
 
@@ -159,12 +174,12 @@ class Subject():
         self.manageOffsetHistory(percentVarianceX)
 
         distance = math.sqrt(abs(self.offsetX) ** 2 + abs(self.offsetY) ** 2)
-        print "Distance: {}".format(distance)
+        self.log.debug("Distance: {}", distance)
         R = scene.imageHeight * 0.15
         if int(distance) <= R:
             self.isCentered = True
         else:
-            print "Evalute func"
+            self.log.debug("Evalute func")
             MARGIN_Y = 0.05 * scene.imageHeight
 
             if self.ycenter > frameCenterY + MARGIN_Y:
@@ -185,13 +200,8 @@ class Subject():
                 self.isFarRight = False
             self.isCentered = False
         if self.debug_mode:
-            print "****************"
-            print "Center", self.isCentered
-            print self.isFarLeft
-            print self.isFarRight
-            print self.isFarUp
-            print self.isFarDown
-            print "****************"
+            self.log.debug("Center {} left {} right {} up {} down {}", self.isCentered,
+                           self.isFarLeft, self.isFarRight, self.isFarUp, self.isFarDown)
 
         return
 
@@ -206,16 +216,99 @@ class Camera():
     zoomPos = -1
     _badPTZcount = 0
 
-    def __init__(self, cfg, usbdevnum):
+    def __init__(self, cfg, usbdevnum, sceneCfg, streamUrl=None):
+        self.readTimeout = cfg["readTimeoutSeconds"]
+
         # Start by establishing control connection
         pysca.connect(cfg['socket'])
+        pysca.set_drive_resend_interval(cfg["driveResendSeconds"])
 
-        # Open video stream as CV camera
+        # Open video stream as CV camera, or the network stream if given
         # print usbdevnum
-        self.cvcamera = cv2.VideoCapture(usbdevnum)
+        if streamUrl:
+            self.cvcamera = StreamSource(streamUrl, cfg["stream"])
+        else:
+            self.cvcamera = cv2.VideoCapture(usbdevnum)
+        self.width = int(self.cvcamera.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cvcamera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if streamUrl:
+            self.pixelFormat = PIXEL_FORMAT_BGR
+        else:
+            self.pixelFormat = self.negotiateMode(cfg, sceneCfg["imageWidth"], sceneCfg["imageHeight"])
+        self.cvreader = CameraReaderAsync.CameraReaderAsync(self.cvcamera, cfg["frameBufferDepth"],
+                                                            cfg["decodeOnDemand"], cfg["stallSeconds"])
+
+    # Pick the smallest capture mode that still covers the processing size
+    # at the target frame rate, trying the pixel formats in order of
+    # preference for each size. Raw YUYV lets detection use the luma plane
+    # directly and undecoded MJPEG can be decoded at reduced scale. Falls
+    # back to the driver's default mode in BGR when nothing is accepted.
+    def negotiateMode(self, cfg, minWidth, minHeight):
+        defaultWidth, defaultHeight = self.width, self.height
+        modes = [tuple(mode) for mode in cfg["captureModes"]
+                 if mode[0] >= minWidth and mode[1] >= minHeight]
+        modes.sort(key=lambda mode: mode[0] * mode[1])
+        for (width, height) in modes:
+            for pixelFormat in cfg["pixelFormats"]:
+                if self.trySetMode(width, height, cfg["targetFps"], pixelFormat):
+                    print "Capture mode: {}x{} at {:.0f} fps, {}".format(
+                        self.width, self.height, self.cvcamera.get(cv2.CAP_PROP_FPS), pixelFormat)
+                    return pixelFormat
+
+        print "WARNING: Camera accepted none of the capture modes, using its default"
+        self.cvcamera.set(cv2.CAP_PROP_FRAME_WIDTH, defaultWidth)
+        self.cvcamera.set(cv2.CAP_PROP_FRAME_HEIGHT, defaultHeight)
+        self.cvcamera.set(cv2.CAP_PROP_CONVERT_RGB, 1)
         self.width = int(self.cvcamera.get(cv2.CAP_PROP_FRAME_WIDTH))
         self.height = int(self.cvcamera.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        self.cvreader = CameraReaderAsync.CameraReaderAsync(self.cvcamera)
+        return PIXEL_FORMAT_BGR
+
+    def trySetMode(self, width, height, fps, pixelFormat):
+        fourccs = {PIXEL_FORMAT_YUYV: "YUYV", PIXEL_FORMAT_MJPEG: "MJPG"}
+        fourcc = None
+        if pixelFormat in fourccs:
+            fourcc = cv2.VideoWriter_fourcc(*fourccs[pixelFormat])
+            self.cvcamera.set(cv2.CAP_PROP_FOURCC, fourcc)
+        self.cvcamera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cvcamera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.cvcamera.set(cv2.CAP_PROP_FPS, fps)
+
+        if int(self.cvcamera.get(cv2.CAP_PROP_FRAME_WIDTH)) != width \
+                or int(self.cvcamera.get(cv2.CAP_PROP_FRAME_HEIGHT)) != height:
+            return False
+        # Some drivers do not report a frame rate at all
+        actualFps = self.cvcamera.get(cv2.CAP_PROP_FPS)
+        if actualFps and actualFps < fps:
+            return False
+        if fourcc is not None and int(self.cvcamera.get(cv2.CAP_PROP_FOURCC)) != fourcc:
+            return False
+        if not self.cvcamera.set(cv2.CAP_PROP_CONVERT_RGB, 0 if fourcc is not None else 1) \
+                and fourcc is not None:
+            return False
+        # The properties may read back right while the backend still
+        # converts frames to BGR, so look at what a frame really holds
+        if fourcc is not None:
+            ok, raw = self.cvcamera.read()
+            if not ok or not self.frameMatches(raw, width, height, pixelFormat):
+                return False
+
+        self.width = width
+        self.height = height
+        return True
+
+    # Whether an unconverted frame has the layout of the pixel format:
+    # two bytes per pixel for YUYV, one row of JPEG data for MJPEG
+    @staticmethod
+    def frameMatches(raw, width, height, pixelFormat):
+        if raw is None:
+            return False
+        if pixelFormat == PIXEL_FORMAT_YUYV:
+            return raw.dtype == np.uint8 and raw.size == width * height * 2
+        if pixelFormat == PIXEL_FORMAT_MJPEG:
+            data = raw.reshape(-1)
+            return raw.dtype == np.uint8 and (raw.ndim == 1 or raw.shape[0] == 1) \
+                and data.size > 2 and data[0] == 0xFF and data[1] == 0xD8
+        return True
 
     # def lostPTZfeed(self):
     #     return True
@@ -259,23 +352,54 @@ class Scene():
     subjectVolatile = True
     confidence = 0.01
     requestedZoomPos = -1
+    # Last commanded (pan speed, tilt speed), None while moving to a position
+    ptzState = (0, 0)
+    # Seconds spent at home and away from it tracking, see accountTime()
+    homeSeconds = 0.0
+    trackingSeconds = 0.0
+    lastAccountTime = 0
 
     # REVERSE = True
 
-    def __init__(self, cfg, camera, stage):
+    def __init__(self, cfg, camera, stage, log):
+        self.log = log
         self.imageWidth = cfg["imageWidth"]
         self.imageHeight = cfg["imageHeight"]
         self.minConfidence = cfg["minConfidence"]
         self.returnHomeSpeed = cfg["returnHomeSpeed"]
         self.homePauseSeconds = cfg["homePauseSeconds"]
+        self.driveFlushSeconds = cfg["driveFlushSeconds"]
 
         self.homePauseTimer = RealtimeInterval(cfg["homePauseSeconds"], True)
         self.zoomTimer = RealtimeInterval(cfg["zoomMaxSecondsSafety"], True)
+        self.driveChannel = pysca.drive_channel(1)
+
+    # Hand the speeds to the drive channel, which sends only the newest
+    # ones once the camera has acknowledged the previous command
+    def drive(self, pan, tilt=0):
+        self.driveChannel.post(pan, tilt)
+        self.ptzState = (pan, tilt)
+
+    # Add the time since the last call to the home or the tracking total
+    def accountTime(self):
+        now = time.time()
+        if self.lastAccountTime:
+            if self.atHome:
+                self.homeSeconds += now - self.lastAccountTime
+            else:
+                self.trackingSeconds += now - self.lastAccountTime
+        self.lastAccountTime = now
 
     def goHome(self, stage):
+        # No queued drive update may land after the move home
+        if not self.driveChannel.flush(discard=True, timeout=self.driveFlushSeconds):
+            self.log.warning("Drive command still unacknowledged after {0} seconds, going home anyway",
+                             self.driveFlushSeconds)
         pysca.pan_tilt(1, 0, 0, blocking=True)
+        self.ptzState = None
         pysca.pan_tilt(1, self.returnHomeSpeed, self.returnHomeSpeed, stage.homePan, stage.homeTilt, blocking=True)
         pysca.set_zoom(1, stage.homeZoom, blocking=True)
+        self.ptzState = (0, 0)
         self.atHome = True
         self.requestedZoomPos = stage.homeZoom
         time.sleep(self.homePauseSeconds)
@@ -288,13 +412,13 @@ class Scene():
                 or not face.recentlyVisible \
                 or subject.isCentered:
             # Stop all tracking motion
-            print "Stop tracking motion"
-            pysca.pan_tilt(1, 0, 0, blocking=True)
+            self.log.debug("Stop tracking motion")
+            self.drive(0, 0)
             return
 
         # Should we return to home position?
         if not face.recentlyVisible and not self.atHome:
-            print 'Go Home'
+            self.log.info("Go Home")
             self.goHome(stage)
             return
 
@@ -326,32 +450,80 @@ class Scene():
         # print 'Speed_x is:\t{}\tSpeed_y is:\t{}'.format(speed_x, speed_y)
         if subject.isFarLeft:
             if subject.isFarUp:
-                print "Object left up"
-                pysca.pan_tilt(1, -speed_x, +speed_y)
+                self.log.debug("Object left up")
+                self.drive(-speed_x, +speed_y)
             elif subject.isFarDown:
-                print "Object left down"
-                pysca.pan_tilt(1, -speed_x, -speed_y)
+                self.log.debug("Object left down")
+                self.drive(-speed_x, -speed_y)
             else:
-                "Object left"
-                pysca.pan_tilt(1, -SPEED)
-            print 'Speed_x is:\t{}\tSpeed_y is:\t{}'.format(speed_x, speed_y)
+                self.log.debug("Object left")
+                self.drive(-SPEED)
+            self.log.debug("Speed_x is: {} Speed_y is: {}", speed_x, speed_y)
         elif subject.isFarRight:
             if subject.isFarUp:
-                print "Object right up"
-                pysca.pan_tilt(1, speed_x, +speed_y)
+                self.log.debug("Object right up")
+                self.drive(speed_x, +speed_y)
                 pass
             elif subject.isFarDown:
-                print "Object right down"
-                pysca.pan_tilt(1, speed_x, -speed_y)
+                self.log.debug("Object right down")
+                self.drive(speed_x, -speed_y)
                 pass
             else:
-                print "Object right"
-                pysca.pan_tilt(1, SPEED)
-            print 'Speed_x is:\t{}\tSpeed_y is:\t{}'.format(speed_x, speed_y)
+                self.log.debug("Object right")
+                self.drive(SPEED)
+            self.log.debug("Speed_x is: {} Speed_y is: {}", speed_x, speed_y)
         self.atHome = False
         return
 
 
+# Follow the face with the tracker when it is still locked on, and fall back
+# to the full detector every few frames or as soon as the tracker drifts.
+# Returns the faces with the number of faces the last detection found.
+def findFaces(gray, face, detector, tracker):
+    if not tracker.needsDetection():
+        box = tracker.update(gray)
+        if box is not None:
+            return [box], tracker.faceCount
+    faces = detector.detect(gray, face)
+    if len(faces):
+        tracker.start(gray, faces[0], detector.faceCount)
+    else:
+        tracker.stop()
+    return faces, detector.faceCount
+
+
+# Hand the frame to the detection worker processes and pick up whatever they
+# have finished. The tracker is re-seeded on the frame each result came from
+# and carried forward to this frame. Returns the faces, or None when there is
+# no news, with the number of faces the last detection found and the capture
+# time of the frame they were found on.
+def pipelineFaces(gray, seq, timestamp, pipeline, tracker):
+    pipeline.submit(gray, seq, timestamp)
+    results = pipeline.poll()
+    faces = None
+    faceCount = 0
+    facesTimestamp = timestamp
+    if results:
+        for result in results[:-1]:
+            pipeline.release(result)
+        latest = results[-1]
+        if len(latest.faces):
+            tracker.start(pipeline.frame(latest), latest.faces[0], len(latest.faces))
+        else:
+            tracker.stop()
+        pipeline.release(latest)
+        faces = latest.faces
+        faceCount = len(latest.faces)
+        facesTimestamp = latest.timestamp
+    if tracker.isTracking():
+        box = tracker.update(gray)
+        if box is not None:
+            faces = [box]
+            faceCount = tracker.faceCount
+            facesTimestamp = timestamp
+    return faces, faceCount, facesTimestamp
+
+
 def printif(message):
     if g_debugMode:
         print message
@@ -359,29 +531,119 @@ def printif(message):
 
 def main(cfg):
     args["usbDeviceNum"] = 2
-    camera = Camera(cfg['camera'], args["usbDeviceNum"])
+    logs = LogWriterAsync(cfg['log'])
+    log = logs.logger("cambot")
+    latency = LatencyProfiler()
+    pysca.set_command_timer(lambda name, seconds: latency.record("visca " + name, seconds))
+    camera = Camera(cfg['camera'], args["usbDeviceNum"], cfg['scene'], args["stream"])
     stage = Stage(cfg['stage'])
-    subject = Subject(cfg['subject'])
+    subject = Subject(cfg['subject'], logs.logger("subject"))
     face = Face(cfg['face'])
-    scene = Scene(cfg['scene'], camera, stage)
+    scene = Scene(cfg['scene'], camera, stage, logs.logger("scene"))
+    camera.cvreader.SetPtzStateSource(lambda: scene.ptzState)
+    detector = FaceDetector(cfg['detector'])
+    tracker = FaceTracker(cfg['tracker'])
+    # Release mode never touches HighGUI
+    display = DebugDisplay("Output", cfg['cambot']['previewMaxFps']) if g_debugMode else None
+    preprocessor = FramePreprocessor(scene.imageWidth,
+                                     pixelFormat=camera.pixelFormat, sourceSize=(camera.width, camera.height))
+    motionGate = MotionGate(cfg['motionGate'])
+    staleness = StalenessPolicy(cfg['camera'])
+    pipeline = None
+    lastFrameSeq = 0
+    framesDropped = 0
+    framesDetected = 0
+    detections = 0
+    lastFaces = []
+    lastFaceCount = 0
+
+    # Runs on the metrics thread for every scrape and only reads loop state
+    def collectMetrics():
+        stages = latency.summary()
+        visca = dict((name[len("visca "):], stages.pop(name)) for name in stages.keys()
+                     if name.startswith("visca "))
+        return [
+            ("cambot_processing_fps", GAUGE, "Frames processed per second",
+             [({}, fpsCounter.getFramerate())]),
+            ("cambot_capture_fps", GAUGE, "Frames captured per second",
+             [({}, camera.cvreader.fps.getFramerate())]),
+            summaryFamily("cambot_stage_latency_seconds", "Latency of each frame loop stage", "stage", stages),
+            ("cambot_stage_latency_max_seconds", GAUGE, "Largest latency seen for each stage",
+             [({"stage": name}, summary["max"]) for name, summary in sorted(stages.items())]),
+            ("cambot_frames_dropped_total", COUNTER, "Frames not processed, by reason",
+             [({"reason": "overrun"}, framesDropped),
+              ({"reason": "stale"}, staleness.framesDropped)]),
+            ("cambot_motion_gate_skipped_total", COUNTER, "Frames that reused the last result as nothing moved",
+             [({}, motionGate.framesSkipped)]),
+            ("cambot_stale_results_total", COUNTER, "Detection results discarded as too old",
+             [({}, staleness.resultsDiscarded)]),
+            ("cambot_frames_detected_total", COUNTER, "Frames the detector or tracker ran on with a result",
+             [({}, framesDetected)]),
+            ("cambot_detections_total", COUNTER, "Faces found over all detected frames",
+             [({}, detections)]),
+            ("cambot_visca_commands_total", COUNTER, "VISCA commands sent",
+             [({}, pysca.stats['commands'])]),
+            ("cambot_visca_timeouts_total", COUNTER, "VISCA timeouts",
+             [({}, pysca.stats['timeouts'])]),
+            ("cambot_visca_drive_updates_total", COUNTER,
+             "Drive updates posted, and sent, replaced unsent, skipped as repeats or failed",
+             [({"outcome": "posted"}, scene.driveChannel.posted),
+              ({"outcome": "sent"}, scene.driveChannel.sent),
+              ({"outcome": "dropped"}, scene.driveChannel.dropped),
+              ({"outcome": "suppressed"}, scene.driveChannel.suppressed),
+              ({"outcome": "failed"}, scene.driveChannel.errors)]),
+            ("cambot_visca_drive_repeats_total", COUNTER, "Repeated drive commands, skipped or resent",
+             [({"outcome": "suppressed"}, pysca.stats['drive_suppressed']),
+              ({"outcome": "resent"}, pysca.stats['drive_resent'])]),
+            summaryFamily("cambot_visca_rtt_seconds", "Round trip time of answered VISCA commands",
+                          "command", visca),
+            ("cambot_scene_seconds_total", COUNTER, "Time spent at home and tracking",
+             [({"state": "home"}, scene.homeSeconds),
+              ({"state": "tracking"}, scene.trackingSeconds)]),
+        ]
 
     fpsDisplay = True
     fpsCounter = WeightedFramerateCounter()
     fpsInterval = RealtimeInterval(10.0, False)
+
+    # Only once everything collectMetrics reads exists
+    exporter = None
+    if cfg['metrics']['enabled']:
+        exporter = MetricsExporter(cfg['metrics'], collectMetrics)
     scene.goHome(stage)
     # Loop on acquisition
     while 1:
         # camera.updatePTZ()
-        raw = None
-        raw = camera.cvreader.Read()
-
-        if raw is not None:
+        # Sleep until the reader hands over a new frame
+        frame = camera.cvreader.WaitForFrame(camera.readTimeout, lease=True)
+        if frame is not None:
+            # From capture to the loop picking the frame up
+            latency.record("capture", time.time() - frame.timestamp)
+            # Frames the reader overwrote before the loop got to them; a
+            # frame picked up but dropped as stale is counted as stale only
+            if lastFrameSeq:
+                framesDropped += frame.seq - lastFrameSeq - 1
+            lastFrameSeq = frame.seq
+
+        if frame is not None and not staleness.admitFrame(frame.timestamp):
+            # Sat in a buffer too long to be worth detecting on
+            camera.cvreader.Release(frame)
+            frame = None
+
+        if frame is not None:
 
             # This is the primary frame processing block
             fpsCounter.tick()
 
-            raw = imutils.resize(raw, width=scene.imageWidth)
-            gray = cv2.cvtColor(raw, cv2.COLOR_BGR2GRAY)
+            # Only build and annotate a colour frame when the preview wants one
+            preprocessor.annotate = display is not None and display.isDue()
+            start = time.time()
+            raw, gray = preprocessor.process(frame.image)
+            latency.record("preprocess", time.time() - start)
+            if gray is None:
+                # Undecodable compressed frame
+                camera.cvreader.Release(frame)
+                continue
 
             # ~ panMsg = "*" if camera.controller.panTiltOngoing() else "-"
             # ~ tiltMsg = "-"
@@ -394,30 +656,54 @@ def main(cfg):
             # ~ cv2.putText(raw, "Z {} #{}".format(zoomMsg, camera.zoomPos), (5, 75),
             # ~ cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
-            # scan for faces here against a grayscale frame
-            cascPath = "haarcascade_frontalface_default.xml"
-            faceCascade = cv2.CascadeClassifier(cascPath)
-            faces = faceCascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(30, 30)
-                # flags = cv2.CV_HAAR_SCALE_IMAGE
-            )
+            # scan for faces here against a grayscale frame, unless nothing
+            # moved since the last scan and the previous result still holds
+            start = time.time()
+            facesTimestamp = frame.timestamp
+            gated = not motionGate.changed(gray)
+            if gated:
+                faces, faceCount = lastFaces, lastFaceCount
+            elif cfg['pipeline']['enabled']:
+                if pipeline is None:
+                    pipeline = DetectionPipeline(cfg['pipeline'], cfg['detector'], gray.shape)
+                faces, faceCount, facesTimestamp = pipelineFaces(gray, frame.seq, frame.timestamp,
+                                                                 pipeline, tracker)
+            else:
+                faces, faceCount = findFaces(gray, face, detector, tracker)
+            latency.record("detect", time.time() - start)
 
             # ~ printif("Found {0} faces!".format(len(faces)))
-            if len(faces):
-                (x, y, w, h) = faces[0]
-
-                cv2.rectangle(raw, (x, y), (x + w, y + h), (255, 0, 0), 2)
-                # cv2.imshow('img', raw)
-
-                face.found(x + w / 2, y + h / 2)
-                # (xcenter = x + w/2)
-            else:
-                face.lost()
-            subject.evaluate(face, scene)
-            scene.trackSubject(camera, stage, subject, face, len(faces))
+            # Judge the result by the frame it was found on, which for a
+            # pipeline result may be several frames back
+            if faces is not None and not staleness.admitResult(facesTimestamp):
+                # Too old by now to steer the camera with
+                faces = None
+
+            if faces is not None:
+                # Reused results were counted when they were found
+                if not gated:
+                    framesDetected += 1
+                    detections += len(faces)
+                lastFaces, lastFaceCount = faces, faceCount
+                if len(faces):
+                    (x, y, w, h) = faces[0]
+
+                    if preprocessor.annotate:
+                        cv2.rectangle(raw, (x, y), (x + w, y + h), (255, 0, 0), 2)
+                    # cv2.imshow('img', raw)
+
+                    face.found(x + w / 2, y + h / 2, w, h)
+                    # (xcenter = x + w/2)
+                else:
+                    face.lost()
+                start = time.time()
+                subject.evaluate(face, scene)
+                latency.record("evaluate", time.time() - start)
+                start = time.time()
+                # A tracked frame holds one face, but confidence goes by how
+                # many the detection saw
+                scene.trackSubject(camera, stage, subject, face, faceCount)
+                latency.record("trackSubject", time.time() - start)
 
             # ~ # Decorate the image with CV findings and camera stats
             # ~ cv2.putText(raw, subject.text(), (5, 105),
@@ -428,31 +714,44 @@ def main(cfg):
 
             # ~ # show the output image with decorations
             # ~ # (not easy to do on Docker)
-            if g_debugMode:
-                cv2.imshow("Output", raw)
+            if preprocessor.annotate:
+                display.show(raw)
+
+            # Hand the captured buffer back to the reader
+            camera.cvreader.Release(frame)
+
+        scene.accountTime()
 
         if fpsDisplay and fpsInterval.hasElapsed():
-            print "{0:.1f} fps (processing)".format(fpsCounter.getFramerate())
+            log.info("{0:.1f} fps (processing)", fpsCounter.getFramerate())
+            log.info("{0} frames dropped, {1} stale frames dropped, {2} stale results discarded",
+                     framesDropped, staleness.framesDropped, staleness.resultsDiscarded)
             # ~ if camera.cvreader is not None:
             # ~ print "{0:.1f} fps (camera)".format(camera.cvreader.fps.getFramerate())
-            print "Face has been seen for {0:.1f} seconds".format(face.age())
+            log.info("Face has been seen for {0:.1f} seconds", face.age())
+            for line in latency.report():
+                log.info("{}", line)
 
         # Monitor for control keystrokes in debug mode
-        if g_debugMode:
-            keyPress = cv2.waitKey(1)
-            if keyPress != -1:
-                keyPress = keyPress & 0xFF
+        if display is not None:
+            keyPress = display.pollKey()
             if keyPress == ord("q"):
                 break
     # Clean up
     printif("Cleaning up")
+    if pipeline is not None:
+        pipeline.stop()
     if camera.cvreader is not None:
         camera.cvreader.Stop()
         time.sleep(0.5)
     if camera.cvcamera is not None:
         camera.cvcamera.release()
-    if g_debugMode:
-        cv2.destroyAllWindows()
+    if display is not None:
+        display.stop()
+    if exporter is not None:
+        exporter.stop()
+    pysca.set_command_timer(None)
+    logs.stop()
 
     printif("End of main function")
 
@@ -462,7 +761,7 @@ ap = argparse.ArgumentParser(description="OpenCV camera operation robot")
 ap.add_argument("--usb", dest="usbDeviceNum", type=int, action="store", default=0,
                 help="USB device number; USB device 0 is the default camera")
 ap.add_argument("--stream", type=str, action="store",
-                help="optional stream context, appended to IP and used instead of USB for CV frame reads")
+                help="optional RTSP/HTTP stream URL or video file, used instead of USB for CV frame reads")
 ap.add_argument("--release", dest="releaseMode", action="store_const", const=True, default=not g_debugMode,
                 help="hides all debug windows (default: False)")
 args = vars(ap.parse_args())
@@ -0,0 +1,152 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+import cv2
+
+import StreamSource
+
+''' check_stream_source.py
+	Exercises StreamSource without a camera or a network stream.
+
+	1. Writes a short video file and reads it back through StreamSource
+	   and the FFmpeg backend: every frame must come back, none dropped.
+	2. Feeds StreamSource a simulated live source on a simulated clock:
+	   a 25 fps stream whose clock runs 0.1% slow for an hour must keep
+	   delivering frames, and a sudden backlog must be skipped at most
+	   maxSkipFrames frames per grab.
+
+	python check_stream_source.py
+	Exits with status 1 when a check fails.
+'''
+
+CFG = {"maxLatencySeconds": 0.2, "stallSeconds": 3, "maxSkipFrames": 25,
+       "captureOptions": ""}
+FILE_FRAMES = 50
+FPS = 25.0
+
+
+def checkFile():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "check.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (320, 240))
+        for i in range(FILE_FRAMES):
+            frame = np.full((240, 320, 3), i * 5 % 256, np.uint8)
+            cv2.putText(frame, str(i), (100, 140), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+            writer.write(frame)
+        writer.release()
+
+        source = StreamSource.StreamSource(path, CFG)
+        read = 0
+        while True:
+            ok, image = source.read()
+            if not ok:
+                break
+            read += 1
+        source.release()
+        print "file: {0} of {1} frames read, {2} dropped".format(read, FILE_FRAMES, source.framesDropped)
+        return read == FILE_FRAMES and source.framesDropped == 0
+    finally:
+        shutil.rmtree(directory)
+
+
+# Clock shared by the simulated source and StreamSource
+class SimulatedTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+# Live source whose frames carry stream times that run slow by clockError.
+# After a stall, the frames produced meanwhile arrive all at once.
+class SimulatedCapture:
+    def __init__(self, clock, clockError):
+        self.clock = clock
+        self.clockError = clockError
+        self.frame = 0
+        self.backlog = 0
+
+    def isOpened(self):
+        return True
+
+    def grab(self):
+        if self.backlog:
+            self.backlog -= 1
+        else:
+            self.clock.now += 1 / FPS
+        self.frame += 1
+        return True
+
+    def get(self, prop):
+        return self.frame / FPS * (1 - self.clockError) * 1000.0
+
+    def set(self, prop, value):
+        return True
+
+    def release(self):
+        pass
+
+    def stall(self, frames):
+        self.clock.now += frames / FPS
+        self.backlog += frames
+
+
+# StreamSource reading from a simulated capture instead of FFmpeg
+class SimulatedStreamSource(StreamSource.StreamSource):
+    def __init__(self, clock, capture):
+        self.clock = clock
+        self.simulated = capture
+        StreamSource.StreamSource.__init__(self, "simulated", CFG)
+
+    def open(self):
+        self.capture = self.simulated
+        self.lastFrameTime = self.clock.time()
+        self.bestOffset = None
+
+
+def checkDrift():
+    clock = SimulatedTime()
+    StreamSource.time = clock
+    source = SimulatedStreamSource(clock, SimulatedCapture(clock, 0.001))
+    frames = int(3600 * FPS)
+    for i in range(frames):
+        source.grab()
+    print "drift: {0} frames over an hour at 0.1% clock error, {1} dropped".format(
+        frames, source.framesDropped)
+    return source.framesDropped == 0
+
+
+def checkBacklog():
+    clock = SimulatedTime()
+    StreamSource.time = clock
+    capture = SimulatedCapture(clock, 0.0)
+    source = SimulatedStreamSource(clock, capture)
+    for i in range(100):
+        source.grab()
+    # Two seconds of frames arrive at once, then eight seconds' worth
+    capture.stall(50)
+    source.grab()
+    dropped = source.framesDropped
+    for i in range(100):
+        source.grab()
+    capture.stall(200)
+    source.grab()
+    longest = source.framesDropped - dropped
+    print "backlog: {0} skipped from a 50 frame burst, {1} from a 200 frame burst".format(dropped, longest)
+    return 0 < dropped <= CFG["maxSkipFrames"] and longest == CFG["maxSkipFrames"]
+
+
+failures = 0
+for check in (checkFile, checkDrift, checkBacklog):
+    if not check():
+        print "FAIL: {}".format(check.__name__)
+        failures += 1
+sys.exit(1 if failures else 0)
@@ -0,0 +1,93 @@
+import sys
+import json
+
+import numpy as np
+import cv2
+
+from FaceDetector import FaceDetector
+
+''' check_tiled_detection.py
+	Checks that tiled detection finds the same faces as a single
+	full-frame detectMultiScale call. The face in a photo is pasted at
+	several sizes and positions onto a 600x450 frame, on and across the
+	tile seams, and the boxes from both modes are compared.
+
+	python check_tiled_detection.py [photo]
+
+	Without a photo, scikit-image's astronaut picture is used.
+	Exits with status 1 when any placement differs.
+'''
+
+FRAME_SIZE = (600, 450)
+FACE_SIZES = (150, 110)
+# Face centres as fractions of the frame; 0.5 lies on the 2x2 tile seams
+PLACEMENTS = [(x / 10.0, y / 10.0) for y in range(3, 8) for x in range(3, 8)]
+
+
+def loadPhoto(argv):
+    if len(argv) > 1:
+        photo = cv2.imread(argv[1], cv2.IMREAD_GRAYSCALE)
+        if photo is None:
+            raise IOError("Could not read '{}'".format(argv[1]))
+        return photo
+    from skimage import data
+    return cv2.cvtColor(data.astronaut(), cv2.COLOR_RGB2GRAY)
+
+
+# Face and its surroundings, cut out so that the face is faceSize pixels wide
+def faceCrop(photo, box, faceSize):
+    (x, y, w, h) = box
+    margin = w // 2
+    crop = photo[max(0, y - margin):y + h + margin, max(0, x - margin):x + w + margin]
+    scale = faceSize / float(w)
+    return cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def paste(crop, center):
+    frameWidth, frameHeight = FRAME_SIZE
+    frame = np.full((frameHeight, frameWidth), 128, np.uint8)
+    cropHeight, cropWidth = crop.shape
+    x0 = min(max(0, int(center[0] * frameWidth) - cropWidth // 2), frameWidth - cropWidth)
+    y0 = min(max(0, int(center[1] * frameHeight) - cropHeight // 2), frameHeight - cropHeight)
+    frame[y0:y0 + cropHeight, x0:x0 + cropWidth] = crop
+    return frame
+
+
+# Same faces, each within a few pixels of its counterpart
+def sameBoxes(single, tiled):
+    if len(single) != len(tiled):
+        return False
+    for box in single:
+        tolerance = max(4, box[2] // 10)
+        if not any(np.all(np.abs(np.asarray(other) - box) <= tolerance) for other in tiled):
+            return False
+    return True
+
+
+def main(argv):
+    with open("config.json", "r") as configFile:
+        cfg = json.load(configFile)["detector"]
+    cfg["roiEnabled"] = False
+    single = FaceDetector(dict(cfg, tiledEnabled=False))
+    tiled = FaceDetector(dict(cfg, tiledEnabled=True))
+
+    photo = loadPhoto(argv)
+    faces = single.detect(photo)
+    if not len(faces):
+        raise ValueError("No face found in the photo")
+
+    failures = 0
+    for faceSize in FACE_SIZES:
+        crop = faceCrop(photo, faces[0], faceSize)
+        for center in PLACEMENTS:
+            frame = paste(crop, center)
+            singleFaces = [list(box) for box in single.detect(frame)]
+            tiledFaces = [list(box) for box in tiled.detect(frame)]
+            ok = sameBoxes(singleFaces, tiledFaces)
+            failures += not ok
+            print "{0} face {1:3d}px at {2}: single {3} tiled {4}".format(
+                "ok  " if ok else "FAIL", faceSize, center, singleFaces, tiledFaces)
+    return 1 if failures else 0
+
+
+sys.exit(main(sys.argv))
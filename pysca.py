@@ -22,6 +22,7 @@ import sys
 import os
 import select
 import threading
+import time
 import Queue
 
 # Timeout for read and write, in seconds
@@ -43,6 +44,8 @@ VISCA_MAX_DEVICES = 7
 VISCA_MAX_SOCKETS = 2
 VISCA_TERMINATOR = 0xFF
 VISCA_TERMINATOR_CHR = chr(VISCA_TERMINATOR)
+# Bytes taken from the serial port per read in the reader thread
+VISCA_READ_SIZE = 1024
 VISCA_BCAST_ADDR = 0x08
 VISCA_BCAST_MASK = 0b1000
 VISCA_BCAST_HEADER = 0x88
@@ -245,6 +248,21 @@ VISCA_INFO_DISPLAY_OFF = 0x03
 H_NIBBLE_MASK = 0xF0
 L_NIBBLE_MASK = 0x0F
 
+# Names under which command round trips are reported to the command timer
+COMMAND_NAMES = {
+    (VISCA_CATEGORY_INTERFACE, VISCA_IF_CLEAR): 'if_clear',
+    (VISCA_CATEGORY_CAMERA, VISCA_POWER): 'power',
+    (VISCA_CATEGORY_CAMERA, VISCA_ZOOM): 'zoom',
+    (VISCA_CATEGORY_CAMERA, VISCA_ZOOM_VALUE): 'zoom_value',
+    (VISCA_CATEGORY_CAMERA, VISCA_FOCUS): 'focus',
+    (VISCA_CATEGORY_CAMERA, VISCA_FOCUS_VALUE): 'focus_value',
+    (VISCA_CATEGORY_PAN_TILTER, VISCA_PT_DRIVE): 'pan_tilt_drive',
+    (VISCA_CATEGORY_PAN_TILTER, VISCA_PT_ABSOLUTE_POSITION): 'pan_tilt_absolute',
+    (VISCA_CATEGORY_PAN_TILTER, VISCA_PT_RELATIVE_POSITION): 'pan_tilt_relative',
+    (VISCA_CATEGORY_PAN_TILTER, VISCA_PT_HOME): 'pan_tilt_home',
+    (VISCA_CATEGORY_PAN_TILTER, VISCA_PT_RESET): 'pan_tilt_reset',
+}
+
 
 # EXCEPTIONS
 class ViscaError(RuntimeError):
@@ -365,6 +383,14 @@ class Packet(bytes):
         # The error handling (packet size, packet terminator, etc.) is done on the constructor
         return cls(packet)
 
+    @classmethod
+    def from_trusted(cls, data):
+        """
+        Wrap bytes that are known to form a valid packet, skipping the checks done in the constructor.
+        Meant for the compiled commands, whose layout is fixed.
+        """
+        return bytes.__new__(cls, data)
+
     @classmethod
     def from_parts(cls, sender=None, recipient=None, *parts):
         """
@@ -511,6 +537,103 @@ class Packet(bytes):
             return None
 
 
+class Response(object):
+    """
+    A packet received from a device. The fields are decoded once, when the packet is framed,
+    so reading them later is a plain attribute access. The payload is a view on the packet bytes.
+    """
+
+    __slots__ = ('data', 'header', 'sender', 'type', 'socket', 'category', 'payload')
+
+    def __init__(self, data):
+        if len(data) < VISCA_MIN_PKG_LEN or \
+                len(data) > VISCA_MAX_PKG_LEN:
+            raise ValueError("Incorrect packet size for '{0}': {1}".format(data.encode('hex'), len(data)))
+
+        if ord(data[-1]) != VISCA_TERMINATOR:
+            raise ValueError("Incorrect terminator byte")
+
+        self.data = data
+        self.header = ord(data[VISCA_HEADER_INDEX])
+        self.sender = (self.header >> 4) & VISCA_ADDR_MASK
+        type_byte = ord(data[VISCA_TYPE_INDEX])
+        self.type = type_byte & H_NIBBLE_MASK
+        self.socket = type_byte & L_NIBBLE_MASK
+        category = ord(data[VISCA_CATEGORY_INDEX])
+        self.category = category if category != VISCA_TERMINATOR else None
+        self.payload = memoryview(data)[1:-1]
+
+    def __str__(self):
+        return self.data.encode('hex')
+
+    @property
+    def subtype(self):
+        return self.socket
+
+    def parse_error(self):
+        """
+        Same as Packet.parse_error: the response itself is returned, errors are not raised for now.
+        """
+        return self
+
+    def int_at(self, index, size):
+        """
+        Decode 'size' nibble-encoded bytes starting at 'index' into an integer,
+        the reverse of Packet.int_to_bytes. Inquiry replies carry their values this way.
+        """
+        data = self.data
+        n = 0
+        for i in xrange(index, index + size):
+            n = (n << 4) | (ord(data[i]) & L_NIBBLE_MASK)
+        return n
+
+    def values(self, *sizes):
+        """
+        Decode the consecutive nibble-encoded values of an inquiry reply, whose sizes in bytes are given.
+        For instance, a pan/tilt position reply decodes with values(4, 4).
+        """
+        index = VISCA_CATEGORY_INDEX
+        result = []
+        for size in sizes:
+            result.append(self.int_at(index, size))
+            index += size
+        return tuple(result)
+
+
+class PacketFramer(object):
+    """
+    Splits the byte stream read from the serial port into packets.
+    Bytes are appended to a reusable buffer, every complete packet is cut out at its terminator,
+    and the bytes of an incomplete packet are kept until the rest of it arrives.
+    """
+
+    def __init__(self):
+        self.__buffer = bytearray()
+        # Bytes thrown away while looking for a terminator
+        self.discarded = 0
+
+    def feed(self, data):
+        """
+        Add the bytes just read and return the complete packets, as 'bytes', in arrival order.
+        """
+        buf = self.__buffer
+        buf.extend(data)
+        packets = []
+        start = 0
+        end = buf.find(VISCA_TERMINATOR_CHR)
+        while end >= 0:
+            packets.append(bytes(buf[start:end + 1]))
+            start = end + 1
+            end = buf.find(VISCA_TERMINATOR_CHR, start)
+        if start:
+            del buf[:start]
+        if len(buf) >= VISCA_MAX_PKG_LEN:
+            # Too long to be the start of a valid packet: resynchronize at the next terminator
+            self.discarded += len(buf)
+            del buf[:]
+        return packets
+
+
 class Socket(object):
     # Socket status codes
     READY = 0
@@ -543,6 +666,7 @@ class Socket(object):
                         self.__waiting -= 1
                         wait = False
                     else:
+                        stats['timeouts'] += 1
                         raise ViscaTimeoutError(
                             "Socket {} did not return an answer after {} seconds".format(self.__number, timeout))
                 elif self.__status == Socket.CLEARING:
@@ -620,18 +744,47 @@ class Device(object):
         self.__sockets = [Socket(i, timeout) for i in range(sockets + 1)]
         # The handler used to send the requests to the device
         self.__send = send_handler
+        # Last drive command sent and when, to skip repeating it (see send_drive)
+        self.__drive_packet = None
+        self.__drive_sent = 0
 
     def send(self, *payload, **kwargs):
+        # Send a command or request to the device
+        return self.send_packet(Packet.from_parts(0, self.address, *payload), **kwargs)
+
+    def send_drive(self, packet, **kwargs):
+        """
+        Send a pan/tilt drive packet, unless it is the drive command last sent and was sent less than
+        'drive_resend_interval' seconds ago. Returns None when the command is skipped.
+        """
+        with self.__send_lock:
+            now = time.time()
+            if packet == self.__drive_packet and now - self.__drive_sent < drive_resend_interval:
+                stats['drive_suppressed'] += 1
+                return None
+            if packet == self.__drive_packet:
+                stats['drive_resent'] += 1
+            response = self.send_packet(packet, **kwargs)
+            self.__drive_packet = packet
+            self.__drive_sent = now
+            return response
+
+    def send_packet(self, packet, **kwargs):
         with self.__send_lock:
-            # Send a command or request to the device
-            packet = Packet.from_parts(0, self.address, *payload)
+            # Any other pan/tilt command, or a clear, leaves the drive state unknown
+            if ord(packet[VISCA_TYPE_INDEX]) == VISCA_COMMAND and \
+                    ord(packet[VISCA_CATEGORY_INDEX]) in (VISCA_CATEGORY_PAN_TILTER, VISCA_CATEGORY_INTERFACE):
+                self.__drive_packet = None
             self.__sockets[0].wait_for_response(packet)
+            stats['commands'] += 1
+            start = time.time()
             self.__send(packet)
             response = self.__sockets[0].get_response()
             if response.type == VISCA_RESPONSE_ACK and kwargs["blocking"]:
-                return self.__sockets[response.socket].get_response()
-            else:
-                return response
+                response = self.__sockets[response.socket].get_response()
+            if command_timer is not None:
+                command_timer(command_name(packet), time.time() - start)
+            return response
 
     def get_response(self, socket=0):
         try:
@@ -695,45 +848,90 @@ __bcast_queue = Queue.Queue()
 # used for signaling
 __pipe = os.pipe()
 
+# Called as command_timer(name, seconds) after each answered command
+command_timer = None
+
+# Running totals of commands sent to devices, of timeouts of any kind, of drive commands
+# skipped because they repeated the last one, and of repeats sent anyway after the resend interval
+stats = {'commands': 0, 'timeouts': 0, 'drive_suppressed': 0, 'drive_resent': 0}
+
+# A drive command that repeats the last one sent to a device is skipped for this many seconds,
+# after which it is sent again in case the camera missed it
+drive_resend_interval = 1.0
+
+
+def set_command_timer(timer):
+    """
+    Register a callable that is told how long each command took to be answered,
+    up to the 'completed' response for blocking commands. Pass None to stop timing.
+    """
+    global command_timer
+    command_timer = timer
+
+
+def set_drive_resend_interval(seconds):
+    """
+    Set how long a repeated drive command is skipped before it is sent again. Zero sends every command.
+    """
+    global drive_resend_interval
+    drive_resend_interval = seconds
+
+
+def command_name(packet):
+    """
+    Short name of the command or inquiry in a packet, as used for timing
+    """
+    category, command = ord(packet[2]), ord(packet[3])
+    name = COMMAND_NAMES.get((category, command), '{:02x}{:02x}'.format(category, command))
+    if ord(packet[1]) == VISCA_INQUIRY:
+        return 'inquiry_' + name
+    return name
+
 
 def __reader():
+    framer = PacketFramer()
     # TODO Handle the "close" command gracefully
     while (__alive):
-        try:
-            # Block till there are bytes to read
-            # self.pipe is a method for releasing the block on shutdown
-            # print "__READER SELECT. THERE ARE", self.__serialport.inWaiting(), "PENDING BYTES"
-            ready, _, _ = select.select([__pipe[0], __serialport], [], [])
-
-            # Read the packet
-            # print "__READER READ PACKET"
-            p = Packet.from_serial(__serialport)
-            # print "Received packet:", p
-
-            # Check the response according to several types
-            if p.header == VISCA_BCAST_HEADER:
-                __bcast_queue.put(p)
-            elif ord(p[1]) == VISCA_ADDR_CHANGE:
-                # print "__READER: Received network change packet!!!"
-                # Read responses in a new thread
-                threading.Thread(target=cmd_address_set()).start()
-            else:
-                # Make the reception of the packet in the corresponding device
-                # Responses with a sender of "0" are broadcast requests, but are duly handled by the device 0
-                # print "Making reception of packet in device", p.sender
-                # TODO: Refactor this
-                __devices[p.sender].recv(p)
-                # TODO: Use logger
-        except KeyError:
-            # TODO: Do not raise exception, or handle gracefully
-            # TODO: Use logger
-            print "WARN: Received packet from an unregistered sender {}: {}".format(p.sender, p)
-            # raise ViscaNoSuchDeviceError("Received packet from an unregistered sender {}: {}".format(p.sender, p))
-        except ValueError as e:
-            # TODO: Do not raise exception, or handle gracefully
+        # Block till there are bytes to read
+        # self.pipe is a method for releasing the block on shutdown
+        ready, _, _ = select.select([__pipe[0], __serialport], [], [])
+        if __serialport not in ready:
+            continue
+
+        # Take whatever the port has in one read, and cut it into packets
+        for data in framer.feed(os.read(__serialport.fileno(), VISCA_READ_SIZE)):
+            __dispatch(data)
+
+
+def __dispatch(data):
+    try:
+        p = Response(data)
+        # print "Received packet:", p
+
+        # Check the response according to several types
+        if p.header == VISCA_BCAST_HEADER:
+            __bcast_queue.put(p)
+        elif p.type | p.socket == VISCA_ADDR_CHANGE:
+            # print "__READER: Received network change packet!!!"
+            # Read responses in a new thread
+            threading.Thread(target=cmd_address_set()).start()
+        else:
+            # Make the reception of the packet in the corresponding device
+            # Responses with a sender of "0" are broadcast requests, but are duly handled by the device 0
+            # print "Making reception of packet in device", p.sender
+            # TODO: Refactor this
+            __devices[p.sender].recv(p)
             # TODO: Use logger
-            print "WARN: Received an incorrect packet: {}".format(e)
-            # raise ValueError("Received an incorrect packet", e)
+    except KeyError:
+        # TODO: Do not raise exception, or handle gracefully
+        # TODO: Use logger
+        print "WARN: Received packet from an unregistered sender {}: {}".format(p.sender, p)
+        # raise ViscaNoSuchDeviceError("Received packet from an unregistered sender {}: {}".format(p.sender, p))
+    except ValueError as e:
+        # TODO: Do not raise exception, or handle gracefully
+        # TODO: Use logger
+        print "WARN: Received an incorrect packet: {}".format(e)
+        # raise ValueError("Received an incorrect packet", e)
 
 
 def __bcast_reader():
@@ -752,9 +950,9 @@ def __bcast_reader():
                 __if_clear_rcvd = True
                 __if_clear_lock.notify()
 
-        elif ord(packet[1]) == VISCA_ADDR_SET:
+        elif packet.type | packet.socket == VISCA_ADDR_SET:
             with __init_addresses_lock:
-                new_addr = ord(packet[2]) - __init_addresses_offset
+                new_addr = packet.category - __init_addresses_offset
                 if new_addr not in __devices:
                     __devices[new_addr] = Device(new_addr, __write_to_serial, timeout=__timeout)
                 else:
@@ -780,6 +978,7 @@ def __write_to_serial(packet):
         except serial.SerialTimeoutException as e:
             # TODO User logger
             print "ERROR: Timeout received when writing to the serial port"
+            stats['timeouts'] += 1
             raise ViscaTimeoutError(e)
         except serial.portNotOpenError as e:
             # TODO User logger
@@ -938,6 +1137,7 @@ def clear_all():
             __if_clear_rcvd = False
         else:
             # Timeout
+            stats['timeouts'] += 1
             raise ViscaTimeoutError("Timeout waiting for a response to an \"clear_all\" command")
 
 
@@ -970,6 +1170,86 @@ def __cmd_dis(device, *parts, **kwargs):
     return __devices[device].send(VISCA_COMMAND, VISCA_CATEGORY_DISPLAY, *parts, **kwargs).parse_error()
 
 
+def __cmd_packet(device, packet, **kwargs):
+    return __devices[device].send_packet(packet, **kwargs).parse_error()
+
+
+def __cmd_drive(device, packet, **kwargs):
+    response = __devices[device].send_drive(packet, **kwargs)
+    return response.parse_error() if response is not None else None
+
+
+# COMPILED COMMANDS
+# The commands sent many times per second skip Packet.from_parts. Drive packets are built once per device
+# and speed combination and cached; position and zoom packets are copied from a byte template and have
+# their speed and nibble fields patched in.
+
+# Byte templates; the header and the variable fields are filled in for each packet
+__pt_position_template = bytearray([0x80, VISCA_COMMAND, VISCA_CATEGORY_PAN_TILTER, VISCA_PT_ABSOLUTE_POSITION,
+                                    0, 0, 0, 0, 0, 0, 0, 0, 0, 0, VISCA_TERMINATOR])
+__zoom_value_template = bytearray([0x80, VISCA_COMMAND, VISCA_CATEGORY_CAMERA, VISCA_ZOOM_VALUE,
+                                   0, 0, 0, 0, VISCA_TERMINATOR])
+
+# Drive packets by (device, pan speed, tilt speed, horizontal direction, vertical direction)
+__drive_packets = {}
+
+
+def __patch_nibbles(buf, offset, number, size):
+    # Same encoding and checks as Packet.int_to_bytes, written into 'buf' at 'offset'
+    n = int(number)
+    if n < 0:
+        raise ValueError("'{}' is not a positive number".format(number))
+    if n >> (4 * size):
+        raise ValueError("The argument '{}' is too high to fit in the specified size '{}'".format(number, size))
+    for i in xrange(offset + size - 1, offset - 1, -1):
+        buf[i] = n & L_NIBBLE_MASK
+        n >>= 4
+
+
+def __compiled_header(device):
+    if device not in VISCA_VALID_ADDRS:
+        raise ValueError("Invalid recipient: {}".format(device))
+    return VISCA_SENDER_MASK | device
+
+
+def drive_packet(device, pan_speed, tilt_speed, horiz, vert):
+    """
+    Pan/tilt drive packet for the given speeds (0 to 0x7F) and directions, built on first use and cached.
+    """
+    key = (device, pan_speed, tilt_speed, horiz, vert)
+    packet = __drive_packets.get(key)
+    if packet is None:
+        packet = Packet.from_parts(0, device, VISCA_COMMAND, VISCA_CATEGORY_PAN_TILTER, VISCA_PT_DRIVE,
+                                   pan_speed, tilt_speed, horiz, vert)
+        __drive_packets[key] = packet
+    return packet
+
+
+def position_packet(device, pan_speed, tilt_speed, pan_position, tilt_position, relative=False):
+    """
+    Absolute or relative pan/tilt position packet, patched into a copy of the position template.
+    """
+    buf = bytearray(__pt_position_template)
+    buf[0] = __compiled_header(device)
+    if relative:
+        buf[3] = VISCA_PT_RELATIVE_POSITION
+    buf[4] = pan_speed
+    buf[5] = tilt_speed
+    __patch_nibbles(buf, 6, pan_position, 4)
+    __patch_nibbles(buf, 10, tilt_position, 4)
+    return Packet.from_trusted(bytes(buf))
+
+
+def zoom_packet(device, zoom):
+    """
+    Direct zoom position packet, patched into a copy of the zoom template.
+    """
+    buf = bytearray(__zoom_value_template)
+    buf[0] = __compiled_header(device)
+    __patch_nibbles(buf, 4, zoom, 4)
+    return Packet.from_trusted(bytes(buf))
+
+
 # POWER control
 def set_power_on(device, on):
     """
@@ -1048,7 +1328,7 @@ def set_zoom(device, zoom, focus=None, blocking=False):
     'focus' should be a 4-byte integer, its acceptable values and their meaning to be found at the device's manual.
     """
     if focus is None:
-        __cmd_cam(device, VISCA_ZOOM_VALUE, Packet.int_to_bytes(zoom, 4), blocking=blocking)
+        __cmd_packet(device, zoom_packet(device, zoom), blocking=blocking)
     else:
         # Sets focus and zoom at the same time
         __cmd_cam(device, VISCA_ZOOM_VALUE, Packet.int_to_bytes(zoom, 4), Packet.int_to_bytes(focus, 4),
@@ -1401,6 +1681,9 @@ def pan_tilt(device, pan=None, tilt=None, pan_position=None, tilt_position=None,
           - The valid range is device-dependent. Please check the reference manual for details.
        * 'relative' indicates if the "_position" arguments must be considered absolute or relative to the current position.
          Defaults to "false" (i.e., the positions are considered absolute by default)
+    A speed-only movement that repeats the last one sent to the device is skipped, unless it was sent more than
+    'drive_resend_interval' seconds ago (see 'set_drive_resend_interval').
+    Returns the device's response, or None when the movement was skipped.
     """
     # TODO Use dictionaries
     # TODO Make this command aware of the 'invert' setting?
@@ -1439,14 +1722,10 @@ def pan_tilt(device, pan=None, tilt=None, pan_position=None, tilt_position=None,
         vert = VISCA_PT_DRIVE_VERT_STOP
 
     if pan_position is not None and tilt_position is not None:
-        if relative:
-            __cmd_pt(device, VISCA_PT_RELATIVE_POSITION, abs(int(pan)), abs(int(tilt)), \
-                     Packet.int_to_bytes(pan_position, 4), Packet.int_to_bytes(tilt_position, 4), blocking=blocking)
-        else:
-            __cmd_pt(device, VISCA_PT_ABSOLUTE_POSITION, abs(int(pan)), abs(int(tilt)), \
-                     Packet.int_to_bytes(pan_position, 4), Packet.int_to_bytes(tilt_position, 4), blocking=blocking)
+        return __cmd_packet(device, position_packet(device, abs(int(pan)), abs(int(tilt)), pan_position,
+                                                    tilt_position, relative), blocking=blocking)
     elif pan_position is None and tilt_position is None:
-        __cmd_pt(device, VISCA_PT_DRIVE, abs(int(pan)), abs(int(tilt)), horiz, vert, blocking=blocking)
+        return __cmd_drive(device, drive_packet(device, abs(int(pan)), abs(int(tilt)), horiz, vert), blocking=blocking)
     else:
         raise ValueError("Both arguments 'tilt_position' and 'pan_position' must be present or absent at the same time")
 
@@ -1465,6 +1744,103 @@ def pan_tilt_reset(device, blocking=False):
     __cmd_pt(device, VISCA_PT_RESET, blocking=blocking)
 
 
+class DriveChannel(object):
+    """
+    Latest-wins pan/tilt drive updates for one device.
+    Callers post the speeds they want and return at once. A sender thread sends the newest posted speeds
+    as soon as the previous drive command has been acknowledged; any speeds posted in between are
+    replaced before they are sent, and counted in 'dropped'. Updates that repeat the drive the device is already
+    doing are not sent either (see 'pan_tilt') and are counted in 'suppressed', failed sends in 'errors'.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.__cond = threading.Condition()
+        self.__pending = None
+        self.__busy = False
+        # Counters
+        self.posted = 0
+        self.sent = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self.errors = 0
+        self.__thread = threading.Thread(target=self.__sender, name="drive-thread-{}".format(device))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def post(self, pan, tilt):
+        """
+        Ask for the camera to drive at these speeds, with the same conventions as 'pan_tilt'. Never blocks on I/O.
+        """
+        with self.__cond:
+            self.posted += 1
+            if self.__pending is not None:
+                self.dropped += 1
+            self.__pending = (pan, tilt)
+            self.__cond.notify_all()
+
+    def flush(self, discard=False, timeout=None):
+        """
+        Wait until the channel is idle: the pending update has been handled, or thrown away when 'discard' is
+        set, and the command in flight has been acknowledged. Returns False if 'timeout' expired first.
+        """
+        with self.__cond:
+            if discard and self.__pending is not None:
+                self.dropped += 1
+                self.__pending = None
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while self.__pending is not None or self.__busy:
+                if timeout is None:
+                    self.__cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.__cond.wait(remaining)
+            return True
+
+    def __sender(self):
+        while True:
+            with self.__cond:
+                while self.__pending is None:
+                    self.__cond.wait()
+                pan, tilt = self.__pending
+                self.__pending = None
+                self.__busy = True
+            try:
+                # Returns when the device acknowledges the command, or at once when it is skipped
+                response = pan_tilt(self.device, pan, tilt)
+                if response is None:
+                    self.suppressed += 1
+                else:
+                    self.sent += 1
+            except Exception as e:
+                # Whatever went wrong, the thread must live on to send the next update
+                self.errors += 1
+                # TODO: Use logger
+                print "WARNING: Drive command to device {} failed: {}".format(self.device, e)
+            finally:
+                # Never leave flush() waiting on a command that is not in flight
+                with self.__cond:
+                    self.__busy = False
+                    self.__cond.notify_all()
+
+
+__drive_channels = {}
+__drive_channels_lock = threading.Lock()
+
+
+def drive_channel(device):
+    """
+    The coalescing drive channel of a device, created on first use.
+    """
+    with __drive_channels_lock:
+        if device not in __drive_channels:
+            __drive_channels[device] = DriveChannel(device)
+        return __drive_channels[device]
+
+
 def osd_off(device, blocking=False):
     """
     Remove OSD info on display